@@ -1,9 +1,13 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from othello import OthelloGame
 from llm_handler import LLMHandler
+from game_store import GameStore
+from trajectory import Trajectory
+import bitboard
 import traceback
 import time
+import json
 import os
 
 app = Flask(__name__)
@@ -15,7 +19,7 @@ CORS(app, resources={
     }
 })
 
-games = {}
+games = GameStore.from_env()
 
 @app.route('/api/start', methods=['POST', 'OPTIONS'])
 def start_game():
@@ -52,129 +56,208 @@ def start_game():
                 'error': f"API key error: {str(e)}. Please check your .env file."
             }), 400
         
-        game_id = str(len(games))
-        games[game_id] = {
-            'game': OthelloGame(),
+        game = OthelloGame()
+        game_data = {
+            'game': game,
             'players': [player1, player2],
             'player_types': [llm1_type, llm2_type],
             'consecutive_skips': 0,
+            'trajectory': Trajectory(),
             'start_time': time.time()
         }
+        game_id = games.create(game_data)
+        game_data['id'] = game_id
         
         return jsonify({
             'gameId': game_id,
-            'board': games[game_id]['game'].get_board_state(),
-            'currentPlayer': games[game_id]['game'].current_player,
-            'playerTypes': games[game_id]['player_types']
+            'board': game.get_board_state(),
+            'currentPlayer': game.current_player,
+            'playerTypes': game_data['player_types']
         })
     except Exception as e:
         print(f"Error in start_game: {str(e)}")
         print(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
+def _finish_game(game_data):
+    """終局時の結果をまとめ、学習を実行（結果はセッションに残し、学習は1局につき1回だけ）"""
+    game = game_data['game']
+
+    # ゲーム統計を収集
+    game_stats = game.get_game_stats()
+    game_stats['duration'] = time.time() - game_data['start_time']
+
+    # 学習を実行
+    LLMHandler.end_game(game.get_winner(), game_data['player_types'], game_data.pop('trajectory'))
+
+    result = {
+        'gameOver': True,
+        'winner': game.get_winner(),
+        'score': game.get_score(),
+        'board': game.get_board_state(),
+        'playerTypes': game_data['player_types'],
+        'gameStats': game_stats
+    }
+    games.finish(game_data['id'], result)
+    return result
+
+def _play_turn(game_data):
+    """1手（またはパス）進めて結果を返す
+
+    戻り値は終局なら _finish_game の結果、パスなら {'skipTurn': True}、
+    着手なら {'lastMove', 'square', 'flips', 'player', 'moveTime'}。
+    """
+    if 'result' in game_data:
+        return game_data['result']
+
+    game = game_data['game']
+
+    if game.is_game_over():
+        return _finish_game(game_data)
+
+    # パスが必要かチェック
+    if game.should_skip_turn():
+        game_data['consecutive_skips'] += 1
+        if game_data['consecutive_skips'] >= 2:
+            # 両プレイヤーが連続でパスした場合、ゲーム終了
+            return _finish_game(game_data)
+
+        # パスして次のプレイヤーへ
+        game.current_player = 3 - game.current_player
+        return {'skipTurn': True}
+
+    # 有効な手があれば、連続パスカウントをリセット
+    game_data['consecutive_skips'] = 0
+
+    current_player_idx = 0 if game.current_player == 1 else 1
+    llm = game_data['players'][current_player_idx]
+    player = game.current_player
+    valid_moves = game.get_valid_moves()
+
+    # 手を取得（タイムアウト付き）
+    start_time = time.time()
+    move = llm.get_move(game, valid_moves)
+    move_time = time.time() - start_time
+
+    result = {'lastMove': None, 'player': player, 'moveTime': round(move_time, 2)}
+    if move:
+        row, col = move
+        black, white = game.black, game.white
+        # 盤面に反映できた手だけを学習用の記録に残す
+        if not game.make_move(row, col):
+            raise ValueError(f"Illegal move {move} for player {player}")
+        game_data['trajectory'].append(black, white, row * 8 + col, player, len(valid_moves))
+        square, flipped, _ = game.move_history[-1]
+        result.update({
+            'lastMove': move,
+            'square': square,
+            'flips': list(bitboard.squares(flipped))
+        })
+    return result
+
 @app.route('/api/move/<game_id>', methods=['GET', 'OPTIONS'])
 def make_move(game_id):
     try:
         if request.method == 'OPTIONS':
             return handle_options_request()
 
-        if game_id not in games:
+        game_data = games.get(game_id)
+        if game_data is None:
+            # 終局してディスクに書き出された対局は結果だけを返す
+            finished = games.load_finished(game_id)
+            if finished is not None:
+                return jsonify(finished)
             return jsonify({'error': 'Game not found'}), 404
             
-        game_data = games[game_id]
         game = game_data['game']
         
-        if game.is_game_over():
-            winner = game.get_winner()
-            score = game.get_score()
-            
-            # ゲーム統計を収集
-            game_stats = game.get_game_stats()
-            game_stats['duration'] = time.time() - game_data['start_time']
-            
-            # 学習を実行
-            LLMHandler.end_game(winner, game_data['player_types'])
-            
-            return jsonify({
-                'gameOver': True,
-                'winner': winner,
-                'score': score,
-                'board': game.get_board_state(),
-                'playerTypes': game_data['player_types'],
-                'gameStats': game_stats
-            })
-        
-        # パスが必要かチェック
-        if game.should_skip_turn():
-            game_data['consecutive_skips'] += 1
-            if game_data['consecutive_skips'] >= 2:
-                # 両プレイヤーが連続でパスした場合、ゲーム終了
-                winner = game.get_winner()
-                score = game.get_score()
-                game_stats = game.get_game_stats()
-                game_stats['duration'] = time.time() - game_data['start_time']
-                
-                LLMHandler.end_game(winner, game_data['player_types'])
-                
-                return jsonify({
-                    'gameOver': True,
-                    'winner': winner,
-                    'score': score,
-                    'board': game.get_board_state(),
-                    'playerTypes': game_data['player_types'],
-                    'gameStats': game_stats
-                })
-            
-            # パスして次のプレイヤーへ
-            game.current_player = 3 - game.current_player
-            return jsonify({
+        # 同じ対局への同時リクエストは1つずつ処理する
+        with game_data['lock']:
+            try:
+                result = _play_turn(game_data)
+            except Exception as e:
+                print(f"Error getting move from LLM: {str(e)}")
+                return jsonify({'error': f"LLM error: {str(e)}"}), 500
+
+            if result.get('gameOver'):
+                return jsonify(result)
+
+            response = {
                 'board': game.get_board_state(),
                 'currentPlayer': game.current_player,
-                'skipTurn': True,
                 'playerTypes': game_data['player_types']
-            })
-        
-        # 有効な手があれば、連続パスカウントをリセット
-        game_data['consecutive_skips'] = 0
-        
-        current_player_idx = 0 if game.current_player == 1 else 1
-        llm = game_data['players'][current_player_idx]
-        
-        valid_moves = game.get_valid_moves()
-        board_string = game.to_string()
-        
-        try:
-            # 手を取得（タイムアウト付き）
-            start_time = time.time()
-            move = llm.get_move(board_string, valid_moves)
-            move_time = time.time() - start_time
-            
-            last_move = None
-            if move:
-                llm.record_move(
-                    game.get_board_state(),
-                    valid_moves,
-                    move,
-                    game.current_player
-                )
-                row, col = move
-                game.make_move(row, col)
-                last_move = move
-            
-            return jsonify({
+            }
+            if result.get('skipTurn'):
+                response['skipTurn'] = True
+            else:
+                response['lastMove'] = result['lastMove']
+                response['moveTime'] = result['moveTime']
+            return jsonify(response)
+
+    except Exception as e:
+        print(f"Error in make_move: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/autoplay/<game_id>', methods=['GET', 'OPTIONS'])
+def autoplay(game_id):
+    """終局まで対局を進め、1手ごとの差分（置いたマスと裏返ったマス）を逐次送る
+
+    ?format=sse でServer-Sent Events、それ以外は1行1イベントのJSON（NDJSON）。
+    マス番号は row * 8 + col。
+    """
+    try:
+        if request.method == 'OPTIONS':
+            return handle_options_request()
+
+        sse = request.args.get('format') == 'sse'
+        mimetype = 'text/event-stream' if sse else 'application/x-ndjson'
+        headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+        def encode(event):
+            line = json.dumps(event, separators=(',', ':'))
+            return f"data: {line}\n\n" if sse else line + "\n"
+
+        game_data = games.get(game_id)
+        if game_data is None:
+            # 終局してディスクに書き出された対局は保存済みの終局イベントだけを送る
+            finished = games.load_finished(game_id)
+            if finished is not None:
+                return Response(encode(finished), mimetype=mimetype, headers=headers)
+            return jsonify({'error': 'Game not found'}), 404
+
+        def generate():
+            game = game_data['game']
+            # 最初に現在の盤面を1度だけ送り、以降は差分だけを送る
+            yield encode({
                 'board': game.get_board_state(),
                 'currentPlayer': game.current_player,
-                'lastMove': last_move,
-                'playerTypes': game_data['player_types'],
-                'moveTime': round(move_time, 2)
+                'playerTypes': game_data['player_types']
             })
-        
-        except Exception as e:
-            print(f"Error getting move from LLM: {str(e)}")
-            return jsonify({'error': f"LLM error: {str(e)}"}), 500
+            while True:
+                try:
+                    with game_data['lock']:
+                        result = _play_turn(game_data)
+                except Exception as e:
+                    print(f"Error in autoplay: {str(e)}")
+                    yield encode({'error': f"LLM error: {str(e)}"})
+                    return
+                if result.get('gameOver'):
+                    yield encode(result)
+                    return
+                if result.get('skipTurn'):
+                    yield encode({'pass': 3 - game.current_player})
+                else:
+                    yield encode({
+                        'square': result.get('square'),
+                        'flips': result.get('flips', []),
+                        'player': result['player'],
+                        'moveTime': result['moveTime']
+                    })
 
+        return Response(stream_with_context(generate()), mimetype=mimetype, headers=headers)
     except Exception as e:
-        print(f"Error in make_move: {str(e)}")
+        print(f"Error in autoplay: {str(e)}")
         print(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
@@ -189,6 +272,19 @@ def get_stats():
         print(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/metrics', methods=['GET', 'OPTIONS'])
+def get_metrics():
+    try:
+        if request.method == 'OPTIONS':
+            return handle_options_request()
+        metrics = LLMHandler.get_metrics()
+        metrics['games'] = games.stats()
+        return jsonify(metrics)
+    except Exception as e:
+        print(f"Error in get_metrics: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/check-keys', methods=['GET', 'OPTIONS'])
 def check_api_keys():
     try:
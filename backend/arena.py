@@ -0,0 +1,223 @@
+"""HTTPを通さずにローカル戦略同士を大量に対戦させる
+
+例:
+    python arena.py search random --games 1000 --workers 8
+    python arena.py ml:gemini search --games 500 --train-as gemini --json
+"""
+import argparse
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from othello import OthelloGame
+
+STRATEGIES = ('random', 'search', 'ml')
+
+# ワーカープロセスごとに1度だけ作る
+_learner = None
+_engines = {}
+
+
+def _get_learner():
+    global _learner
+    if _learner is None:
+        from ml_strategy import GameLearning
+        _learner = GameLearning(background_training=False)
+    return _learner
+
+
+def _get_engine(options):
+    key = (options['search_time'], options['endgame_empties'])
+    if key not in _engines:
+        from search import SearchEngine
+        _engines[key] = SearchEngine(time_budget=options['search_time'],
+                                     endgame_empties=options['endgame_empties'])
+    return _engines[key]
+
+
+def choose_move(strategy, game, valid_moves, rng, options):
+    """戦略名に応じて手を選ぶ（'ml:gemini' のようにモデルの種類を指定できる）"""
+    name, _, model_type = strategy.partition(':')
+    if name == 'random':
+        return rng.choice(valid_moves)
+    if name == 'search':
+        return _get_engine(options).get_game_move(game)
+    if name == 'ml':
+        return _get_learner().get_move_suggestion(
+            model_type or 'gemini', game.get_board_state(), valid_moves, game.current_player)
+    raise ValueError(f"Unknown strategy: {strategy}")
+
+
+def play_game(black, white, seed, options, record=False):
+    """1局を最後まで打ち、結果（と必要なら学習用の手の記録）を返す"""
+    rng = random.Random(seed)
+    game = OthelloGame()
+    strategies = {2: black, 1: white}
+    moves = []
+    while not game.is_game_over():
+        if game.should_skip_turn():
+            game.current_player = 3 - game.current_player
+            continue
+        valid_moves = game.get_valid_moves()
+        move = choose_move(strategies[game.current_player], game, valid_moves, rng, options)
+        if move not in valid_moves:
+            move = valid_moves[0]
+        if record:
+            moves.append({
+                'board': game.get_board_state(),
+                'valid_moves': valid_moves,
+                'move': move,
+                'player_type': options['train_as'],
+                'current_player': game.current_player
+            })
+        game.make_move(*move)
+
+    result = {
+        'black': black,
+        'white': white,
+        'winner': game.get_winner(),
+        'score': game.get_score()
+    }
+    if record:
+        result['moves'] = moves
+    return result
+
+
+def _play_chunk(task):
+    """ワーカープロセスで複数局をまとめて打つ"""
+    strategy_a, strategy_b, seeds, options = task
+    results = []
+    for seed in seeds:
+        # 先手と後手を交互に入れ替える
+        if seed % 2 == 0:
+            black, white = strategy_a, strategy_b
+        else:
+            black, white = strategy_b, strategy_a
+        results.append(play_game(black, white, seed, options, record=bool(options['train_as'])))
+    return results
+
+
+def wilson_interval(wins, total, z=1.96):
+    """勝率の95%信頼区間（Wilsonの方法）"""
+    if total == 0:
+        return 0.0, 0.0
+    p = wins / total
+    denominator = 1 + z * z / total
+    center = (p + z * z / (2 * total)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / total + z * z / (4 * total * total)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def summarize(results, strategy_a, strategy_b, elapsed):
+    summary = {}
+    for strategy in (strategy_a, strategy_b):
+        wins = draws = losses = 0
+        for result in results:
+            if strategy not in (result['black'], result['white']):
+                continue
+            color = 2 if result['black'] == strategy else 1
+            if result['winner'] == color:
+                wins += 1
+            elif result['winner'] == 0:
+                draws += 1
+            else:
+                losses += 1
+        total = wins + draws + losses
+        # 引き分けは0.5勝として扱う
+        low, high = wilson_interval(wins + 0.5 * draws, total)
+        summary[strategy] = {
+            'wins': wins,
+            'draws': draws,
+            'losses': losses,
+            'win_rate': round((wins + 0.5 * draws) / total, 4) if total else 0.0,
+            'ci95': [round(low, 4), round(high, 4)]
+        }
+    return {
+        'games': len(results),
+        'elapsed': round(elapsed, 3),
+        'games_per_second': round(len(results) / elapsed, 2) if elapsed > 0 else None,
+        'strategies': summary
+    }
+
+
+def run_arena(strategy_a, strategy_b, games, workers=None, chunk_size=25, seed=0, options=None):
+    """2つの戦略を games 局対戦させ、(集計, 各局の結果) を返す"""
+    if strategy_a == strategy_b:
+        raise ValueError("Use two different strategies (e.g. 'ml:gemini' vs 'ml:llama')")
+    options = dict({'search_time': 0.01, 'endgame_empties': 8, 'train_as': None}, **(options or {}))
+    seeds = list(range(seed, seed + games))
+    tasks = [(strategy_a, strategy_b, seeds[i:i + chunk_size], options)
+             for i in range(0, games, chunk_size)]
+
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in executor.map(_play_chunk, tasks):
+            results.extend(chunk)
+    elapsed = time.perf_counter() - start
+    return summarize(results, strategy_a, strategy_b, elapsed), results
+
+
+def train_from_results(results, model_type):
+    """対戦の記録をGameLearningの学習データとして使う"""
+    learner = _get_learner()
+    games = [{
+        'moves': result['moves'],
+        'winner': result['winner'],
+        'players': [model_type, model_type]
+    } for result in results]
+    return learner.train_games(games)
+
+
+def self_play_records(n, search_time=0.01, workers=None, seed=0):
+    """探索と完全ランダムの対戦をn局行い、1局ごとの対局レコードの配列のリストを返す"""
+    from game_records import records_from_moves
+    _, results = run_arena('search', 'random', n, workers=workers, seed=seed,
+                           options={'search_time': search_time, 'train_as': 'self_play'})
+    return [records_from_moves(result['moves'], result['winner']) for result in results]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run headless matches between local strategies.')
+    parser.add_argument('strategy_a', help="random, search or ml[:model_type]")
+    parser.add_argument('strategy_b', help="random, search or ml[:model_type]")
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=25)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--search-time', type=float, default=0.01, help='seconds per search move')
+    parser.add_argument('--endgame-empties', type=int, default=8, help='empties at which search solves exactly')
+    parser.add_argument('--train-as', choices=['gemini', 'llama', 'dify'],
+                        help='feed the games to GameLearning as training data for this model')
+    parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+    args = parser.parse_args()
+
+    for strategy in (args.strategy_a, args.strategy_b):
+        if strategy.partition(':')[0] not in STRATEGIES:
+            parser.error(f"unknown strategy: {strategy}")
+
+    summary, results = run_arena(
+        args.strategy_a, args.strategy_b, args.games,
+        workers=args.workers, chunk_size=args.chunk_size, seed=args.seed,
+        options={'search_time': args.search_time, 'endgame_empties': args.endgame_empties,
+                 'train_as': args.train_as}
+    )
+    if args.train_as:
+        summary['trained'] = train_from_results(results, args.train_as)
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    print(f"\n=== 対戦結果 ({summary['games']}局, {summary['games_per_second']}局/秒) ===")
+    for strategy, stat in summary['strategies'].items():
+        low, high = stat['ci95']
+        print(f"{strategy}: {stat['wins']}勝 {stat['draws']}分 {stat['losses']}敗 "
+              f"勝率 {stat['win_rate'] * 100:.1f}% (95%CI {low * 100:.1f}-{high * 100:.1f}%)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,408 @@
+"""エンジン・特徴量・学習・APIの処理速度を測るベンチマーク
+
+局面の集合（序盤・中盤・終盤）は乱数の種から毎回同じものを作るので、
+版ごとの結果をJSONで保存しておけば速くなったか遅くなったかを比べられる。
+学習済みモデル・定石・重みファイルは使わず、一時ディレクトリで測る（LLMへの問い合わせはスタブ）。
+
+例:
+    python benchmark.py                                  # 全項目を測って結果をJSONで表示
+    python benchmark.py --only perft features --output before.json
+    python benchmark.py --compare before.json            # 保存した結果との比（1より大きければ速くなった）
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import re
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import bitboard
+from othello import OthelloGame
+
+BENCHMARK_VERSION = 1  # 測り方や局面の集合を変えたら上げる（違う版の結果とは比べない）
+PHASES = {
+    # 局面の集合の名前: 空きマス数の範囲
+    'opening': (48, 56),
+    'midgame': (28, 40),
+    'endgame': (10, 20),
+}
+PERFT_DEPTH = 6  # 初期局面からの深さ（葉の数は8200）
+PERFT_CORPUS_DEPTH = 3  # 集合の局面からの深さ
+BENCHMARKS = ('perft', 'features', 'suggestions', 'training', 'api')
+
+
+def make_corpus(seed=0, count=100):
+    """ランダムな対局から段階ごとにcount個ずつ局面を集める（[(black, white, 手番), ...] の辞書）"""
+    rng = random.Random(seed)
+    corpus = {phase: [] for phase in PHASES}
+    while any(len(positions) < count for positions in corpus.values()):
+        # 1局から段階ごとに1局面ずつ取る
+        candidates = {phase: [] for phase in PHASES}
+        black, white, player = bitboard.INITIAL_BLACK, bitboard.INITIAL_WHITE, 2
+        while True:
+            mover, other = (black, white) if player == 2 else (white, black)
+            moves = bitboard.legal_moves(mover, other)
+            if not moves:
+                if not bitboard.legal_moves(other, mover):
+                    break
+                player = 3 - player
+                continue
+            empties = 64 - bitboard.popcount(black | white)
+            for phase, (low, high) in PHASES.items():
+                if low <= empties <= high:
+                    candidates[phase].append((black, white, player))
+            mover, other = bitboard.play(mover, other, rng.choice(list(bitboard.squares(moves))))
+            black, white = (mover, other) if player == 2 else (other, mover)
+            player = 3 - player
+        for phase, positions in candidates.items():
+            if positions and len(corpus[phase]) < count:
+                corpus[phase].append(rng.choice(positions))
+    return corpus
+
+
+def make_games(seed=0, count=20):
+    """ランダムな対局をcount局打ち、train_gamesに渡せる手のリストの形式で返す"""
+    rng = random.Random(seed)
+    games = []
+    for _ in range(count):
+        game = OthelloGame()
+        moves = []
+        while not game.is_game_over():
+            if game.should_skip_turn():
+                game.current_player = 3 - game.current_player
+                continue
+            valid_moves = game.get_valid_moves()
+            move = rng.choice(valid_moves)
+            moves.append({
+                'board': game.get_board_state(),
+                'valid_moves': valid_moves,
+                'move': move,
+                'player_type': ('gemini', 'llama')[len(moves) % 2],
+                'current_player': game.current_player
+            })
+            game.make_move(*move)
+        games.append({'moves': moves, 'winner': game.get_winner(), 'players': ['gemini', 'llama']})
+    return games
+
+
+def _best_of(function, repeat):
+    """repeat回測って最短の経過時間を返す（最後の戻り値も返す）"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _rate(count, elapsed):
+    return round(count / elapsed, 2) if elapsed > 0 else None
+
+
+def perft(player, opponent, depth):
+    """ビットボードでdepth手先までの (葉の数, 訪れた局面数) を数える（パスも1手とする）"""
+    if depth == 0:
+        return 1, 1
+    moves = bitboard.legal_moves(player, opponent)
+    if not moves:
+        if not bitboard.legal_moves(opponent, player):
+            return 1, 1  # 終局
+        leaves, nodes = perft(opponent, player, depth - 1)
+        return leaves, nodes + 1
+    leaves = nodes = 0
+    for square in bitboard.squares(moves):
+        new_player, new_opponent = bitboard.play(player, opponent, square)
+        child_leaves, child_nodes = perft(new_opponent, new_player, depth - 1)
+        leaves += child_leaves
+        nodes += child_nodes
+    return leaves, nodes + 1
+
+
+def perft_game(game, depth):
+    """OthelloGameの get_valid_moves / make_move / undo_last_move で同じ数を数える"""
+    if depth == 0:
+        return 1, 1
+    valid_moves = game.get_valid_moves()
+    if not valid_moves:
+        if game.is_game_over():
+            return 1, 1
+        game.current_player = 3 - game.current_player
+        leaves, nodes = perft_game(game, depth - 1)
+        game.current_player = 3 - game.current_player
+        return leaves, nodes + 1
+    leaves = nodes = 0
+    for row, col in valid_moves:
+        game.make_move(row, col)
+        child_leaves, child_nodes = perft_game(game, depth - 1)
+        game.undo_last_move()
+        leaves += child_leaves
+        nodes += child_nodes
+    return leaves, nodes + 1
+
+
+def bench_perft(corpus, repeat):
+    results = {}
+    elapsed, (leaves, nodes) = _best_of(
+        lambda: perft(bitboard.INITIAL_BLACK, bitboard.INITIAL_WHITE, PERFT_DEPTH), repeat)
+    results['initial_bitboard'] = {'depth': PERFT_DEPTH, 'leaves': leaves, 'nodes': nodes,
+                                   'seconds': round(elapsed, 4), 'nodes_per_second': _rate(nodes, elapsed)}
+    elapsed, (leaves, nodes) = _best_of(lambda: perft_game(OthelloGame(), PERFT_DEPTH), repeat)
+    results['initial_game'] = {'depth': PERFT_DEPTH, 'leaves': leaves, 'nodes': nodes,
+                               'seconds': round(elapsed, 4), 'nodes_per_second': _rate(nodes, elapsed)}
+
+    for phase, positions in corpus.items():
+        def run():
+            total_leaves = total_nodes = 0
+            for black, white, player in positions:
+                mover, other = (black, white) if player == 2 else (white, black)
+                leaves, nodes = perft(mover, other, PERFT_CORPUS_DEPTH)
+                total_leaves += leaves
+                total_nodes += nodes
+            return total_leaves, total_nodes
+        elapsed, (leaves, nodes) = _best_of(run, repeat)
+        results[phase] = {'depth': PERFT_CORPUS_DEPTH, 'positions': len(positions), 'leaves': leaves,
+                          'nodes': nodes, 'nodes_per_second': _rate(nodes, elapsed)}
+    return results
+
+
+def _boards(positions):
+    return [bitboard.to_board(black, white) for black, white, _ in positions]
+
+
+def _valid_moves(black, white, player):
+    mover, other = (black, white) if player == 2 else (white, black)
+    return [(s >> 3, s & 7) for s in bitboard.squares(bitboard.legal_moves(mover, other))]
+
+
+def bench_features(learner, corpus, repeat):
+    results = {}
+    for phase, positions in corpus.items():
+        boards = _boards(positions)
+        valid_moves = [_valid_moves(*position) for position in positions]
+        mobility = [len(moves) for moves in valid_moves]
+        players = [player for _, _, player in positions]
+        batch_elapsed, X = _best_of(
+            lambda: learner._extract_features_batch(np.array(boards), mobility, players), repeat)
+        single_elapsed, _ = _best_of(
+            lambda: [learner._extract_features(board, moves, player)
+                     for board, moves, player in zip(boards, valid_moves, players)], repeat)
+        results[phase] = {
+            'positions': len(positions),
+            'n_features': int(X.shape[1]),
+            'batch_per_second': _rate(len(positions), batch_elapsed),
+            'single_per_second': _rate(len(positions), single_elapsed)
+        }
+    return results
+
+
+def bench_suggestions(learner, corpus, repeat, model_type='gemini'):
+    results = {}
+    for phase, positions in corpus.items():
+        boards = _boards(positions)
+        args = [(board, _valid_moves(*position), position[2]) for board, position in zip(boards, positions)]
+
+        def run():
+            np.random.seed(0)  # トーナメント選択の乱数
+            return [learner.get_move_suggestion(model_type, board, valid_moves, player)
+                    for board, valid_moves, player in args]
+        elapsed, _ = _best_of(run, repeat)
+        results[phase] = {
+            'positions': len(positions),
+            'candidates': sum(len(valid_moves) for _, valid_moves, _ in args),
+            'model_trained': hasattr(learner.models.get(model_type), 'estimators_'),
+            'per_second': _rate(len(positions), elapsed)
+        }
+    return results
+
+
+def bench_training(learner, games):
+    """1局ずつの追加学習と、保存済みレコードからの学び直しにかかる時間"""
+    from game_records import RecordReader, records_from_moves
+
+    for game in games:
+        learner.records.append(records_from_moves(game['moves'], game['winner']))
+
+    per_game = []
+    for game in games:
+        start = time.perf_counter()
+        learner.train_games([game])
+        per_game.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    trained = learner.learn_from_history(RecordReader(learner.store.records_directory))
+    history_elapsed = time.perf_counter() - start
+    return {
+        'games': len(games),
+        'moves': sum(len(game['moves']) for game in games),
+        'seconds_per_game': round(float(np.mean(per_game)), 4),
+        'seconds_per_game_p95': round(float(np.percentile(per_game, 95)), 4),
+        'learn_from_history_seconds': round(history_elapsed, 4),
+        'learn_from_history_models': trained
+    }
+
+
+def _stub_providers(latency):
+    """LLMプロバイダーを、プロンプトの有効な手の先頭を返すだけのスタブに差し替える"""
+    import llm_providers
+
+    class StubProvider(llm_providers.LLMProvider):
+        async def _generate(self, prompt):
+            await asyncio.sleep(latency)
+            match = re.search(r'有効な手: (\d+,\d+)', prompt)
+            return match.group(1) if match else '0,0'
+
+    for name in ('gemini', 'llama', 'dify'):
+        provider = StubProvider()
+        provider.name = name
+        llm_providers._providers[name] = provider
+
+
+def bench_api(games, latency):
+    """Flaskのテストクライアントで対局を最後まで進め、/api/move の処理速度を測る"""
+    import app as app_module
+    _stub_providers(latency)
+    client = app_module.app.test_client()
+
+    latencies = []
+    start = time.perf_counter()
+    for i in range(games):
+        players = ('gemini', 'llama') if i % 2 == 0 else ('llama', 'gemini')
+        response = client.post('/api/start', json={'player1': players[0], 'player2': players[1]})
+        game_id = response.get_json()['gameId']
+        while True:
+            request_start = time.perf_counter()
+            data = client.get(f'/api/move/{game_id}').get_json()
+            latencies.append(time.perf_counter() - request_start)
+            if data.get('gameOver') or 'error' in data:
+                break
+    elapsed = time.perf_counter() - start
+    return {
+        'games': games,
+        'requests': len(latencies),
+        'llm_latency': latency,
+        'requests_per_second': _rate(len(latencies), elapsed),
+        'latency_p50': round(float(np.percentile(latencies, 50)), 4),
+        'latency_p95': round(float(np.percentile(latencies, 95)), 4),
+        'latency_max': round(float(max(latencies)), 4)
+    }
+
+
+def _isolate(directory):
+    """保存済みのモデルや定石を読まないように、保存先を一時ディレクトリに向ける"""
+    os.environ['MODEL_DIR'] = os.path.join(directory, 'models')
+    os.environ['OPENING_BOOK_PATH'] = os.path.join(directory, 'opening_book.npy')
+    os.environ['PATTERN_WEIGHTS_PATH'] = os.path.join(directory, 'pattern_weights.npy')
+    os.environ.pop('MOVE_CACHE_PATH', None)
+    os.environ.pop('PATTERN_EVAL', None)
+    os.environ.pop('GAME_SPILL_DIR', None)
+    for key in ('GOOGLE_API_KEY', 'HUGGINGFACE_API_KEY', 'DIFY_API_KEY', 'DIFY_API_ENDPOINT'):
+        os.environ[key] = 'benchmark'
+
+
+def run(only=BENCHMARKS, seed=0, positions=100, games=20, api_games=2, repeat=3, llm_latency=0.0):
+    """指定した項目を測り、結果の辞書を返す"""
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        _isolate(directory)
+        corpus = make_corpus(seed, positions)
+        if 'perft' in only:
+            results['perft'] = bench_perft(corpus, repeat)
+
+        learner = None
+        if {'features', 'suggestions', 'training'} & set(only):
+            from ml_strategy import GameLearning
+            learner = GameLearning(background_training=False)
+        if 'features' in only:
+            results['features'] = bench_features(learner, corpus, repeat)
+        if 'suggestions' in only:
+            results['suggestions_untrained'] = bench_suggestions(learner, corpus, repeat)
+        if 'training' in only:
+            results['training'] = bench_training(learner, make_games(seed, games))
+        if 'suggestions' in only and 'training' in only:
+            # 学習済みのモデルでの推論も測る
+            results['suggestions_trained'] = bench_suggestions(learner, corpus, repeat)
+        if 'api' in only:
+            results['api'] = bench_api(api_games, llm_latency)
+
+    return {
+        'version': BENCHMARK_VERSION,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count()
+        },
+        'settings': {'seed': seed, 'positions': positions, 'games': games, 'api_games': api_games,
+                     'repeat': repeat, 'llm_latency': llm_latency},
+        'results': results
+    }
+
+
+_HIGHER_IS_BETTER = ('per_second',)
+_LOWER_IS_BETTER = ('seconds', 'latency')
+
+
+def compare(current, baseline):
+    """同じ項目の数値の比（新/旧、1より大きければ速くなった）を入れ子の辞書で返す"""
+    if current.get('version') != baseline.get('version'):
+        return {'error': f"benchmark version mismatch: {baseline.get('version')} -> {current.get('version')}"}
+
+    def walk(new, old):
+        ratios = {}
+        for key, value in new.items():
+            if key not in old:
+                continue
+            if isinstance(value, dict) and isinstance(old[key], dict):
+                nested = walk(value, old[key])
+                if nested:
+                    ratios[key] = nested
+            elif isinstance(value, (int, float)) and isinstance(old[key], (int, float)) \
+                    and not isinstance(value, bool) and value and old[key]:
+                if any(word in key for word in _HIGHER_IS_BETTER):
+                    ratios[key] = round(value / old[key], 3)
+                elif any(word in key for word in _LOWER_IS_BETTER):
+                    ratios[key] = round(old[key] / value, 3)
+        return ratios
+
+    return walk(current['results'], baseline['results'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the engine, features, training and the API.')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--positions', type=int, default=100, help='positions per corpus phase')
+    parser.add_argument('--games', type=int, default=20, help='random games for the training benchmark')
+    parser.add_argument('--api-games', type=int, default=2, help='games played through the Flask test client')
+    parser.add_argument('--repeat', type=int, default=3, help='repetitions (the fastest one is reported)')
+    parser.add_argument('--llm-latency', type=float, default=0.0, help='seconds the stub LLM waits per request')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to compare against')
+    args = parser.parse_args()
+
+    # 計測中のログ（戦績レポートなど）は標準エラーに回し、標準出力にはJSONだけを出す
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run(only=args.only, seed=args.seed, positions=args.positions, games=args.games,
+                     api_games=args.api_games, repeat=args.repeat, llm_latency=args.llm_latency)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            report['comparison'] = compare(report, json.load(f))
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""64ビット整数2枚で盤面を表現するビットボード演算
+
+マス番号は row * 8 + col で、ビット位置と一致する。
+"""
+
+FULL = 0xFFFFFFFFFFFFFFFF
+NOT_COL0 = 0xFEFEFEFEFEFEFEFE  # 0列目以外
+NOT_COL7 = 0x7F7F7F7F7F7F7F7F  # 7列目以外
+
+INITIAL_WHITE = (1 << 27) | (1 << 36)  # (3,3), (4,4)
+INITIAL_BLACK = (1 << 28) | (1 << 35)  # (3,4), (4,3)
+
+
+def _shift_e(x):
+    return (x << 1) & NOT_COL0 & FULL
+
+
+def _shift_w(x):
+    return (x >> 1) & NOT_COL7
+
+
+def _shift_s(x):
+    return (x << 8) & FULL
+
+
+def _shift_n(x):
+    return x >> 8
+
+
+def _shift_se(x):
+    return (x << 9) & NOT_COL0 & FULL
+
+
+def _shift_sw(x):
+    return (x << 7) & NOT_COL7 & FULL
+
+
+def _shift_ne(x):
+    return (x >> 7) & NOT_COL0
+
+
+def _shift_nw(x):
+    return (x >> 9) & NOT_COL7
+
+
+SHIFTS = (_shift_e, _shift_w, _shift_s, _shift_n, _shift_se, _shift_sw, _shift_ne, _shift_nw)
+
+
+def legal_moves(player, opponent):
+    """手番側の合法手をビットマスクで返す"""
+    empty = ~(player | opponent) & FULL
+    moves = 0
+    for shift in SHIFTS:
+        t = shift(player) & opponent
+        t |= shift(t) & opponent
+        t |= shift(t) & opponent
+        t |= shift(t) & opponent
+        t |= shift(t) & opponent
+        t |= shift(t) & opponent
+        moves |= shift(t) & empty
+    return moves
+
+
+def flips(player, opponent, square):
+    """squareに置いたときに裏返る石をビットマスクで返す"""
+    placed = 1 << square
+    result = 0
+    for shift in SHIFTS:
+        line = 0
+        x = shift(placed)
+        while x & opponent:
+            line |= x
+            x = shift(x)
+        if x & player:
+            result |= line
+    return result
+
+
+def play(player, opponent, square):
+    """squareに打った後の (手番側, 相手側) のビットボードを返す（合法手が前提）"""
+    flipped = flips(player, opponent, square)
+    return player | (1 << square) | flipped, opponent & ~flipped
+
+
+ROW0 = 0x00000000000000FF
+ROW7 = 0xFF00000000000000
+COL0 = 0x0101010101010101
+COL7 = 0x8080808080808080
+
+# 各軸の (正方向のシフト, 負方向のシフト, 負方向の盤外に接するマス, 正方向の盤外に接するマス)
+# 以下の関数は整数のほか、NumPyのuint64配列にもそのまま使える（盤面ごとに一定の手数で計算する）
+_AXES = (
+    (_shift_e, _shift_w, COL0, COL7),  # 横
+    (_shift_s, _shift_n, ROW0, ROW7),  # 縦
+    (_shift_se, _shift_nw, ROW0 | COL0, ROW7 | COL7),  # 右下がりの斜め
+    (_shift_sw, _shift_ne, ROW0 | COL7, ROW7 | COL0),  # 右上がりの斜め
+)
+
+
+def full_lines(occupied):
+    """軸ごとに、そのマスを通る列が端から端まで埋まっているマスのマスク（横, 縦, 斜め, 斜め）"""
+    empty = ~occupied & FULL
+    lines = []
+    for forward, backward, _, _ in _AXES:
+        # 空きマスを列に沿って両方向に広げ、届かなかったマスが埋まった列
+        reach = empty
+        for _ in range(7):
+            reach = reach | forward(reach) | backward(reach)
+        lines.append(~reach & FULL)
+    return lines
+
+
+def stable_discs(player, opponent):
+    """手番側の確定石（以後どう打たれても裏返らない石）のマスク
+
+    4つの軸のそれぞれで、列が埋まっているか、どちらかの隣が盤外か手番側の確定石なら確定とし、
+    角から辺・内側へ広がらなくなるまで繰り返す（全ての確定石ではなく、確実に確定と言える石を返す）。
+    """
+    lines = full_lines(player | opponent)
+    stable = 0
+    while True:
+        candidate = player
+        for (forward, backward, back_wall, front_wall), full in zip(_AXES, lines):
+            # forward(stable) は負方向の隣が確定石のマス、backward(stable) は正方向の隣が確定石のマス
+            candidate = candidate & (full | forward(stable) | back_wall | backward(stable) | front_wall)
+        if _all_equal(candidate, stable):
+            return candidate
+        stable = candidate
+
+
+def _all_equal(a, b):
+    # 整数でも配列でも使えるように比較する
+    equal = a == b
+    return equal if isinstance(equal, bool) else bool(equal.all())
+
+
+def _neighbours(x):
+    """xの8近傍のマスク"""
+    result = 0
+    for shift in SHIFTS:
+        result |= shift(x)
+    return result
+
+
+def frontier_discs(player, opponent):
+    """空きマスに接している手番側の石（相手に手を与えやすい石）のマスク"""
+    return player & _neighbours(~(player | opponent) & FULL)
+
+
+def potential_mobility(player, opponent):
+    """相手の石に接している空きマス（これから手番側の合法手になりうるマス）のマスク"""
+    return _neighbours(opponent) & ~(player | opponent) & FULL
+
+
+def popcount(x):
+    return bin(x).count('1')
+
+
+def squares(mask):
+    """ビットマスクに含まれるマス番号を昇順に列挙"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def from_board(board):
+    """8x8のリスト盤面を (black, white) のビットボードに変換"""
+    black = white = 0
+    for i in range(8):
+        row = board[i]
+        for j in range(8):
+            if row[j] == 2:
+                black |= 1 << (i * 8 + j)
+            elif row[j] == 1:
+                white |= 1 << (i * 8 + j)
+    return black, white
+
+
+def to_board(black, white):
+    """(black, white) のビットボードを8x8のリスト盤面に変換"""
+    board = []
+    for i in range(8):
+        row = []
+        for j in range(8):
+            bit = 1 << (i * 8 + j)
+            row.append(2 if black & bit else 1 if white & bit else 0)
+        board.append(row)
+    return board
@@ -0,0 +1,80 @@
+import numpy as np
+
+
+class CompiledForest:
+    """学習済みRandomForestClassifierの木を平坦な配列に変換し、NumPyだけで推論する
+
+    全ての木のノードを1つの配列に連結し、全サンプル×全木を同時に1段ずつ辿る。
+    葉ノードは自分自身を子に持たせているので、最大の深さだけ繰り返せば全て葉に到達する。
+    """
+
+    def __init__(self, left, right, feature, threshold, proba, roots, classes, max_depth):
+        self.left = left
+        self.right = right
+        self.feature = feature
+        self.threshold = threshold
+        self.proba = proba
+        self.roots = roots
+        self.classes = classes
+        self.max_depth = max_depth
+
+    @classmethod
+    def from_sklearn(cls, model):
+        lefts, rights, features, thresholds, probas, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            nodes = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+            lefts.append(np.where(is_leaf, nodes, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, nodes, tree.children_right) + offset)
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            # 葉の値をクラスごとの確率に正規化（sklearnのバージョンにより件数か割合かが異なる）
+            value = tree.value[:, 0, :]
+            totals = value.sum(axis=1, keepdims=True)
+            probas.append(value / np.where(totals > 0, totals, 1))
+            roots.append(offset)
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            np.concatenate(lefts).astype(np.int32),
+            np.concatenate(rights).astype(np.int32),
+            np.concatenate(features).astype(np.int32),
+            np.concatenate(thresholds),
+            np.concatenate(probas),
+            np.array(roots, dtype=np.int32),
+            np.asarray(model.classes_),
+            max_depth
+        )
+
+    def predict_proba(self, X):
+        """(N, F) の特徴量に対する (N, クラス数) の確率（木の平均）"""
+        # sklearnと同じくfloat32に丸めてから閾値と比較する
+        X = np.asarray(X, dtype=np.float32)
+        n = len(X)
+        nodes = np.repeat(self.roots.reshape(1, -1), n, axis=0)
+        rows = np.arange(n).reshape(-1, 1)
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return self.proba[nodes].mean(axis=1)
+
+    def to_arrays(self):
+        """保存用に配列の辞書へ変換（読み込み時にメモリマップできる形）"""
+        return {
+            'left': self.left,
+            'right': self.right,
+            'feature': self.feature,
+            'threshold': self.threshold,
+            'proba': self.proba,
+            'roots': self.roots,
+            'classes': self.classes,
+            'max_depth': self.max_depth
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(**arrays)
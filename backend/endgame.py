@@ -0,0 +1,197 @@
+import bitboard
+
+# 盤面を4x4の4区画に分けたマスク（偶数理論の判定に使用）
+QUADRANTS = (0x000000000F0F0F0F, 0x00000000F0F0F0F0, 0x0F0F0F0F00000000, 0xF0F0F0F000000000)
+
+# 同じ区画内でのマスの優先度（角 > 辺 > 内側 > Cマス > Xマス）
+_SQUARE_PRIORITY = [
+    0, 3, 1, 1, 1, 1, 3, 0,
+    3, 4, 2, 2, 2, 2, 4, 3,
+    1, 2, 2, 2, 2, 2, 2, 1,
+    1, 2, 2, 2, 2, 2, 2, 1,
+    1, 2, 2, 2, 2, 2, 2, 1,
+    1, 2, 2, 2, 2, 2, 2, 1,
+    3, 4, 2, 2, 2, 2, 4, 3,
+    0, 3, 1, 1, 1, 1, 3, 0,
+]
+
+FASTEST_FIRST_EMPTIES = 7  # これより空きが多いときは相手の着手数が少ない手から読む
+CACHE_MIN_EMPTIES = 7  # これ以上空きがある局面の結果を記録して再利用する
+CACHE_MAX_ENTRIES = 1 << 16
+MAX_SOLVE_EMPTIES = 12  # リクエスト処理中に完全読みする空きマス数の上限
+
+
+def _final_diff(player, opponent):
+    """終局時の石差（空きマスは勝った側に加える）"""
+    p = bitboard.popcount(player)
+    o = bitboard.popcount(opponent)
+    empties = 64 - p - o
+    if p > o:
+        return p - o + empties
+    if p < o:
+        return p - o - empties
+    return 0
+
+
+class EndgameSolver:
+    """終盤の完全読み（最終石差と最善手を求める）"""
+
+    def __init__(self):
+        self.nodes = 0
+        self._bounds = {}  # (player, opponent) -> (下限, 上限)
+
+    def solve(self, player, opponent, alpha=-64, beta=64):
+        """手番側から見た最終石差と最善手のマス番号を返す
+
+        パスしかできない場合の最善手はNone。
+        """
+        self.nodes = 0
+        if len(self._bounds) > CACHE_MAX_ENTRIES:
+            self._bounds.clear()
+        moves = bitboard.legal_moves(player, opponent)
+        if not moves:
+            if not bitboard.legal_moves(opponent, player):
+                return _final_diff(player, opponent), None
+            return -self._solve(opponent, player, -beta, -alpha, True), None
+
+        empty = ~(player | opponent) & bitboard.FULL
+        best_score = -65
+        best_move = None
+        for square in self._order(player, opponent, moves, empty):
+            flipped = bitboard.flips(player, opponent, square)
+            score = -self._solve(opponent & ~flipped, player | (1 << square) | flipped, -beta, -alpha)
+            if score > best_score:
+                best_score = score
+                best_move = square
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return best_score, best_move
+
+    def _order(self, player, opponent, moves, empty):
+        """偶数理論と速攻（相手の着手数の少ない手）による並べ替え"""
+        # 空きマスが奇数個の区画を優先する
+        odd = 0
+        for quadrant in QUADRANTS:
+            if bitboard.popcount(empty & quadrant) & 1:
+                odd |= quadrant
+        squares = list(bitboard.squares(moves))
+        if bitboard.popcount(empty) <= FASTEST_FIRST_EMPTIES:
+            return sorted(squares, key=lambda s: (not odd >> s & 1, _SQUARE_PRIORITY[s]))
+
+        keyed = []
+        for square in squares:
+            flipped = bitboard.flips(player, opponent, square)
+            reply = bitboard.legal_moves(opponent & ~flipped, player | (1 << square) | flipped)
+            keyed.append((bitboard.popcount(reply), not odd >> square & 1, _SQUARE_PRIORITY[square], square))
+        keyed.sort()
+        return [k[3] for k in keyed]
+
+    def _solve(self, player, opponent, alpha, beta, passed=False):
+        self.nodes += 1
+        empty = ~(player | opponent) & bitboard.FULL
+        n_empty = bitboard.popcount(empty)
+        if n_empty <= 3:
+            return self._solve_last(player, opponent, alpha, beta, list(bitboard.squares(empty)))
+
+        moves = bitboard.legal_moves(player, opponent)
+        if not moves:
+            if passed:
+                return _final_diff(player, opponent)
+            return -self._solve(opponent, player, -beta, -alpha, True)
+
+        cached = n_empty >= CACHE_MIN_EMPTIES
+        if cached:
+            # 同じ局面の既知の範囲で探索窓を狭める
+            key = (player, opponent)
+            lower, upper = self._bounds.get(key, (-64, 64))
+            if lower >= beta:
+                return lower
+            if upper <= alpha:
+                return upper
+            if lower == upper:
+                return lower
+            alpha = max(alpha, lower)
+            beta = min(beta, upper)
+            alpha_start, beta_start = alpha, beta
+
+        best = -65
+        first = True
+        for square in self._order(player, opponent, moves, empty):
+            flipped = bitboard.flips(player, opponent, square)
+            child_player = opponent & ~flipped
+            child_opponent = player | (1 << square) | flipped
+            if first:
+                score = -self._solve(child_player, child_opponent, -beta, -alpha)
+                first = False
+            else:
+                # 2手目以降はnull windowで最善手より悪いことを確かめる
+                score = -self._solve(child_player, child_opponent, -alpha - 1, -alpha)
+                if alpha < score < beta:
+                    score = -self._solve(child_player, child_opponent, -beta, -score)
+            if score > best:
+                best = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+
+        if cached:
+            if best <= alpha_start:
+                upper = min(upper, best)
+            elif best >= beta_start:
+                lower = max(lower, best)
+            else:
+                lower = upper = best
+            self._bounds[key] = (lower, upper)
+        return best
+
+    def _solve_last(self, player, opponent, alpha, beta, empties, passed=False):
+        """残り3マス以下の専用処理（合法手マスクを作らず空きマスを直接試す）"""
+        if len(empties) == 1:
+            return self._solve_one(player, opponent, empties[0])
+
+        best = -65
+        for i, square in enumerate(empties):
+            flipped = bitboard.flips(player, opponent, square)
+            if not flipped:
+                continue
+            self.nodes += 1
+            rest = empties[:i] + empties[i + 1:]
+            score = -self._solve_last(opponent & ~flipped, player | (1 << square) | flipped,
+                                      -beta, -alpha, rest)
+            if score > best:
+                best = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        return best
+
+        if best == -65:
+            # 手番側は置けない
+            if passed:
+                return _final_diff(player, opponent)
+            return -self._solve_last(opponent, player, -beta, -alpha, empties, True)
+        return best
+
+    def _solve_one(self, player, opponent, square):
+        """最後の1マスの石差を直接計算"""
+        self.nodes += 1
+        diff = 2 * bitboard.popcount(player) - 63  # 最後の1マスを除いた石差
+        flipped = bitboard.flips(player, opponent, square)
+        if flipped:
+            return diff + 2 * bitboard.popcount(flipped) + 1
+        flipped = bitboard.flips(opponent, player, square)
+        if flipped:
+            return diff - 2 * bitboard.popcount(flipped) - 1
+        # どちらも置けない場合は空きマスを勝った側に加える
+        if diff > 0:
+            return diff + 1
+        if diff < 0:
+            return diff - 1
+        return 0
+
+
+# プロセス内で共有する完全読み（読んだ局面の結果を対局間で再利用する）
+shared_solver = EndgameSolver()
@@ -0,0 +1,145 @@
+"""対局の記録を固定長レコードのバイナリ形式で追記・読み込みする
+
+1レコードは1手（打つ前の局面・手・結果）で、セグメントファイルに追記していく。
+読み込みはメモリマップで行い、Pythonオブジェクトを作らずにNumPyの配列としてまとめて取り出す。
+"""
+import glob
+import os
+import threading
+
+import numpy as np
+
+import bitboard
+
+RECORD_VERSION = 1  # レコードの形式を変えたら上げる（ファイル名に含める）
+SEGMENT_RECORDS = 1 << 20  # 1セグメントファイルあたりのレコード数
+MODEL_TYPES = ('gemini', 'llama', 'dify', 'search', 'ensemble')
+UNKNOWN_MODEL = 255
+
+RECORD_DTYPE = np.dtype([
+    ('black', '<u8'),  # 打つ前の黒石のビットボード
+    ('white', '<u8'),  # 打つ前の白石のビットボード
+    ('square', 'u1'),  # 打ったマス（row * 8 + col）
+    ('player', 'u1'),  # 打った側（1: 白, 2: 黒）
+    ('mobility', 'u1'),  # 打つ前の有効手の数
+    ('model', 'u1'),  # 打ったプレイヤーの種類（MODEL_TYPESの添字）
+    ('result', 'i1'),  # 打った側から見た勝敗（1: 勝ち, 0: 引き分け, -1: 負け）
+    ('disc_diff', 'i1'),  # 打った側から見た終局時の石差
+])
+
+
+def model_index(model_type):
+    return MODEL_TYPES.index(model_type) if model_type in MODEL_TYPES else UNKNOWN_MODEL
+
+
+def records_from_moves(moves, winner):
+    """手ごとの辞書のリスト（旧形式の対局履歴やarenaの記録）をレコード配列に変換"""
+    records = np.zeros(len(moves), dtype=RECORD_DTYPE)
+    if not moves:
+        return records
+    for i, move in enumerate(moves):
+        black, white = bitboard.from_board(move['board'])
+        player = move['current_player']
+        records[i] = (black, white, move['move'][0] * 8 + move['move'][1], player,
+                      len(move['valid_moves']), model_index(move['player_type']),
+                      0 if winner == 0 else 1 if winner == player else -1, 0)
+    fill_disc_diff(records)
+    return records
+
+
+def fill_disc_diff(records):
+    """1局分のレコード配列のdisc_diffを、最後の手を打った後の盤面から埋める"""
+    if not len(records):
+        return
+    # 最後の手を打った後の盤面が終局の盤面（その後はパスしかない）
+    last = records[-1]
+    black, white = int(last['black']), int(last['white'])
+    if last['player'] == 2:
+        black, white = bitboard.play(black, white, int(last['square']))
+    else:
+        white, black = bitboard.play(white, black, int(last['square']))
+    black_diff = bitboard.popcount(black) - bitboard.popcount(white)
+    records['disc_diff'] = np.where(records['player'] == 2, black_diff, -black_diff)
+
+
+def _segment_paths(directory):
+    return sorted(glob.glob(os.path.join(directory, f'records-v{RECORD_VERSION}-*.bin')))
+
+
+class RecordWriter:
+    """レコードをセグメントファイルに追記する（スレッドセーフ）"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def append(self, records):
+        records = np.asarray(records, dtype=RECORD_DTYPE)
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            paths = _segment_paths(self.directory)
+            index = len(paths) - 1 if paths else 0
+            written = 0
+            while written < len(records):
+                path = os.path.join(self.directory, f'records-v{RECORD_VERSION}-{index:06d}.bin')
+                count = 0
+                if os.path.exists(path):
+                    size = os.path.getsize(path)
+                    count = size // RECORD_DTYPE.itemsize
+                    if size % RECORD_DTYPE.itemsize:
+                        # 書き込み途中で止まった端数を切り捨ててから追記する
+                        os.truncate(path, count * RECORD_DTYPE.itemsize)
+                room = SEGMENT_RECORDS - count
+                if room <= 0:
+                    index += 1
+                    continue
+                chunk = records[written:written + room]
+                with open(path, 'ab') as f:
+                    f.write(chunk.tobytes())
+                written += len(chunk)
+
+
+class RecordReader:
+    """セグメントファイルをメモリマップで読み、レコード配列をバッチごとに返す"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def segments(self):
+        """各セグメントのメモリマップ（末尾の書きかけのレコードは除く）"""
+        for path in _segment_paths(self.directory):
+            count = os.path.getsize(path) // RECORD_DTYPE.itemsize
+            if count:
+                yield np.memmap(path, dtype=RECORD_DTYPE, mode='r', shape=(count,))
+
+    def __len__(self):
+        return sum(os.path.getsize(path) // RECORD_DTYPE.itemsize for path in _segment_paths(self.directory))
+
+    def iter_batches(self, batch_size=65536, model_type=None):
+        """最大batch_size件ずつのレコード配列を古い順に返す（model_typeを指定するとそのプレイヤーの手だけ）"""
+        index = None if model_type is None else model_index(model_type)
+        for segment in self.segments():
+            for start in range(0, len(segment), batch_size):
+                batch = segment[start:start + batch_size]
+                if index is not None:
+                    batch = batch[batch['model'] == index]
+                if len(batch):
+                    yield batch
+
+    def tail(self, count, model_type=None):
+        """最新のcount件のレコード（メモリ上の配列）"""
+        if count <= 0:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        batches = []
+        total = 0
+        index = None if model_type is None else model_index(model_type)
+        for segment in reversed(list(self.segments())):
+            if index is not None:
+                segment = segment[segment['model'] == index]
+            batches.append(np.asarray(segment[-(count - total):]))
+            total += len(batches[-1])
+            if total >= count:
+                break
+        if not batches:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        return np.concatenate(batches[::-1])
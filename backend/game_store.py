@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+DEFAULT_MAX_GAMES = 1000
+DEFAULT_TTL = 3600  # 最後のアクセスからこの秒数が過ぎた対局は捨てる
+
+
+class GameStore:
+    """対局セッション（app.pyのgame_data辞書）を保持する
+
+    最後にアクセスされた順に並べ、上限数とTTLを超えた古いものから捨てるので、
+    長時間動かしてもメモリ使用量は一定に収まる。IDはUUIDで、同時に作成しても重複しない。
+    各セッションには 'lock' を持たせ、同じ対局への同時リクエストを直列化する。
+    spill_dirを指定すると、終局した対局の結果をJSONで書き出してメモリから外す。
+    """
+
+    def __init__(self, max_games=DEFAULT_MAX_GAMES, ttl=DEFAULT_TTL, spill_dir=None):
+        self.max_games = max_games
+        self.ttl = ttl
+        self.spill_dir = spill_dir
+        self._sessions = OrderedDict()  # game_id -> game_data
+        self._lock = threading.Lock()
+        self.created = 0
+        self.evicted = 0
+        self.spilled = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_games=int(os.getenv('GAME_STORE_SIZE', DEFAULT_MAX_GAMES)),
+            ttl=float(os.getenv('GAME_TTL', DEFAULT_TTL)),
+            spill_dir=os.getenv('GAME_SPILL_DIR')
+        )
+
+    def create(self, game_data):
+        """セッションを登録してIDを返す"""
+        game_id = uuid.uuid4().hex[:16]
+        game_data['lock'] = threading.Lock()
+        game_data['last_access'] = time.time()
+        with self._lock:
+            self._sessions[game_id] = game_data
+            self.created += 1
+            self._evict()
+        return game_id
+
+    def get(self, game_id):
+        """セッションを返す（なければNone）"""
+        with self._lock:
+            self._evict()
+            game_data = self._sessions.get(game_id)
+            if game_data is not None:
+                game_data['last_access'] = time.time()
+                self._sessions.move_to_end(game_id)
+            return game_data
+
+    def finish(self, game_id, result):
+        """終局した対局の結果を記録し、プレイヤーなど不要になったものを手放す"""
+        with self._lock:
+            game_data = self._sessions.get(game_id)
+            if game_data is None:
+                return
+            game_data['result'] = result
+            game_data.pop('players', None)
+            if self.spill_dir and self._spill(game_id, result):
+                del self._sessions[game_id]
+
+    def load_finished(self, game_id):
+        """ディスクに書き出した終局済みの対局の結果を返す（なければNone）"""
+        path = self._spill_path(game_id)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error loading finished game {game_id}: {e}")
+            return None
+
+    def _spill_path(self, game_id):
+        # IDは16進数のみ（パスとして安全）
+        if not self.spill_dir or not all(c in '0123456789abcdef' for c in game_id):
+            return None
+        return os.path.join(self.spill_dir, f'{game_id}.json')
+
+    def _spill(self, game_id, result):
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            path = self._spill_path(game_id)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f)
+            os.replace(tmp_path, path)
+            self.spilled += 1
+            return True
+        except Exception as e:
+            print(f"Error spilling game {game_id}: {e}")
+            return False
+
+    def _evict(self):
+        """TTL切れと上限超過のセッションを古い順に捨てる（self._lockを保持して呼ぶ）"""
+        now = time.time()
+        while self._sessions:
+            game_id, game_data = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_games and now - game_data['last_access'] <= self.ttl:
+                break
+            del self._sessions[game_id]
+            self.evicted += 1
+            if 'result' in game_data and self.spill_dir:
+                self._spill(game_id, game_data['result'])
+
+    def __contains__(self, game_id):
+        with self._lock:
+            return game_id in self._sessions
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active': len(self._sessions),
+                'finished': sum(1 for game_data in self._sessions.values() if 'result' in game_data),
+                'max_games': self.max_games,
+                'created': self.created,
+                'evicted': self.evicted,
+                'spilled': self.spilled
+            }
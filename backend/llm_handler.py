@@ -1,139 +1,157 @@
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
-import requests
-from huggingface_hub import InferenceClient
 from ml_strategy import GameLearning
+import llm_providers
+from move_cache import MoveCache
+from opening_book import OpeningBook
+import bitboard
+import search
+from search import SearchEngine
 import json
 import re
 
 load_dotenv()
 
+FALLBACK_TIME_BUDGET = 0.2  # LLMが使えないときのローカル探索の持ち時間（秒）
+ENSEMBLE_PROVIDERS = os.getenv("ENSEMBLE_PROVIDERS", "gemini,llama,dify").split(",")
+ENSEMBLE_MODE = os.getenv("ENSEMBLE_MODE", "race")  # race: 最初の有効な手, vote: 締め切りまでの多数決
+PROMPT_VERSION = 2  # プロンプトを変えたら上げる（古い応答のキャッシュを使わないため）
+
+# プロンプトのテンプレート（盤面は X: 手番側, O: 相手, .: 空き で、各行の先頭が行番号）
+_PROMPT_BODY = """あなたは熟練のオセロプレイヤー(X)です。
+盤面 (X:自分 O:相手 .:空き、列は0-7):
+ 01234567
+{board}
+有効な手: {moves}
+角を最優先し、相手に角を与える手を避け、安定した石を増やしてください。{hint}
+「行番号,列番号」の形式で1手だけ返してください。例: 2,3"""
+_PROMPT_TEMPLATES = {
+    'llama': "<s>[INST] " + _PROMPT_BODY + " [/INST]",
+    'default': _PROMPT_BODY
+}
+_ML_HINT = "\n機械学習の分析では {0},{1} が有望です。"
+_CELL_CHARS = {
+    2: {0: '.', 2: 'X', 1: 'O'},
+    1: {0: '.', 1: 'X', 2: 'O'}
+}
+
 class LLMHandler:
     _game_learning = GameLearning()
-    _moves_history = []
+    _move_cache = MoveCache.from_env()
+    _opening_book = OpeningBook.load()
 
     def __init__(self, model_type):
         """APIキーの存在を確認し、なければエラーを発生"""
         self.model_type = model_type
-        if model_type == "gemini":
-            api_key = os.getenv("GOOGLE_API_KEY")
-            if not api_key:
-                raise ValueError("Gemini API key not found. Please set GOOGLE_API_KEY in .env file")
-            genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel('gemini-pro')
-        elif model_type == "llama":
-            api_key = os.getenv("HUGGINGFACE_API_KEY")
-            if not api_key:
-                raise ValueError("Hugging Face API key not found. Please set HUGGINGFACE_API_KEY in .env file")
-            self.client = InferenceClient(
-                model="meta-llama/Llama-3-8b-instruct",
-                token=api_key
-            )
-        elif model_type == "dify":
-            self.api_key = os.getenv("DIFY_API_KEY")
-            self.api_endpoint = os.getenv("DIFY_API_ENDPOINT")
-            if not self.api_key or not self.api_endpoint:
-                raise ValueError("Dify API credentials not found. Please set DIFY_API_KEY and DIFY_API_ENDPOINT in .env file")
-
-    def _convert_board_text_to_array(self, board_text):
-        board = []
-        lines = board_text.strip().split('\n')[1:]
-        for line in lines:
-            row = []
-            cells = line.split()[1:]
-            for cell in cells:
-                if cell == '-':
-                    row.append(0)
-                elif cell == 'W':
-                    row.append(1)
-                elif cell == 'B':
-                    row.append(2)
-            board.append(row)
-        return board
-
-    def get_move(self, board_state, valid_moves):
-        """LLMと機械学習を組み合わせて最適な手を選択"""
+        self.fallback_search = SearchEngine(time_budget=FALLBACK_TIME_BUDGET)
+        if model_type in ("gemini", "llama", "dify"):
+            # APIキーがなければValueError（接続はプロセス内で共有する）
+            self.provider = llm_providers.get_provider(model_type)
+        elif model_type == "ensemble":
+            # APIキーが設定されているプロバイダーすべてに同時に問い合わせる
+            self.providers = []
+            for name in ENSEMBLE_PROVIDERS:
+                try:
+                    self.providers.append(llm_providers.get_provider(name.strip()))
+                except ValueError:
+                    continue
+            if not self.providers:
+                raise ValueError("No LLM API keys found for the ensemble. Please set at least one provider key in .env file")
+        elif model_type == "search":
+            # APIを使わずにローカル探索で指す
+            self.engine = SearchEngine(time_budget=float(os.getenv("SEARCH_TIME_BUDGET", "1.0")))
+
+    def get_move(self, game, valid_moves=None):
+        """LLMと機械学習を組み合わせて最適な手を選択（gameはOthelloGame）"""
+        current_player = game.current_player
+        if valid_moves is None:
+            valid_moves = game.get_valid_moves()
+        board_array = game.get_board_state()
         try:
-            # ボードの状態を解析
-            board_array = self._convert_board_text_to_array(board_state)
-            
+            # 序盤は定石にある手をそのまま指す
+            book_move = self._opening_book.get_move(game.black, game.white, current_player)
+            if book_move in valid_moves:
+                return book_move
+
+            if self.model_type == "search":
+                return self.engine.get_game_move(game)
+
+            # 終盤は完全読みで指し、LLMを呼ばない
+            empties = 64 - bitboard.popcount(game.black | game.white)
+            if empties <= self.fallback_search.endgame_empties:
+                move = self.fallback_search.get_game_move(game)
+                if move in valid_moves:
+                    return move
+
+            # 同じ局面（回転・反転を含む）でLLMが以前返した手があれば再利用
+            cached = self._move_cache.get(self.model_type, game.black, game.white, current_player, PROMPT_VERSION)
+            if cached in valid_moves:
+                return cached
+
             # 機械学習モデルから提案を取得
             ml_suggestion = self._game_learning.get_move_suggestion(
                 self.model_type,
                 board_array,
                 valid_moves,
-                2 if board_state.count('B') > board_state.count('W') else 1
+                current_player
             )
 
-            # プロンプトを生成
-            prompt = self._create_prompt(board_state, valid_moves, ml_suggestion)
-            
             try:
-                if self.model_type == "gemini":
-                    response = self.model.generate_content(prompt)
-                    if not response.text:
-                        raise Exception("Empty response from Gemini")
-                    move_text = response.text
-                elif self.model_type == "llama":
-                    response = self.client.text_generation(
-                        prompt,
-                        max_new_tokens=50,
-                        temperature=0.7,
-                        top_p=0.9,
-                        repetition_penalty=1.1,
-                        do_sample=True
-                    )
-                    if not response:
-                        raise Exception("Empty response from Llama")
-                    move_text = response.strip()
-                else:  # dify
-                    headers = {
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json"
-                    }
-                    data = {
-                        "query": prompt,
-                        "response_mode": "blocking",
-                        "conversation_id": "",
-                        "user": "user"
-                    }
-                    
-                    api_url = f"{self.api_endpoint.rstrip('/')}/chat-messages"
-                    response = requests.post(
-                        api_url,
-                        headers=headers,
-                        json=data,
-                        timeout=10
-                    )
-                    
-                    if response.status_code != 200:
-                        raise Exception(f"API returned status {response.status_code}")
-                    
-                    response_data = response.json()
-                    move_text = response_data.get("answer", "")
-                    if not move_text:
-                        raise Exception("Empty response from API")
-
-                # LLMの応答から座標を抽出
-                move = self._extract_move_from_response(move_text, valid_moves)
+                # 締め切りを過ぎたら待たずにローカルの手で指す
+                move = self._ask_llm(board_array, valid_moves, current_player, ml_suggestion)
                 if move:
+                    self._move_cache.put(self.model_type, game.black, game.white, current_player,
+                                         PROMPT_VERSION, move)
                     return move
 
                 if ml_suggestion and ml_suggestion in valid_moves:
                     print(f"Using ML suggestion: {ml_suggestion}")
                     return ml_suggestion
 
-                # 最後の手段として最初の有効な手を選択
-                return valid_moves[0]
+                # 最後の手段としてローカル探索の手を選択
+                return self._fallback_move(game, valid_moves)
 
             except Exception as e:
+                # LLMの呼び出しに失敗した場合は機械学習の提案かローカル探索で指す
                 print(f"Error in LLM response processing: {e}")
-                return ml_suggestion if ml_suggestion in valid_moves else valid_moves[0]
+                if ml_suggestion and ml_suggestion in valid_moves:
+                    return ml_suggestion
+                return self._fallback_move(game, valid_moves)
 
         except Exception as e:
             print(f"Error in get_move: {e}")
-            return valid_moves[0] if valid_moves else None
+            return self._fallback_move(game, valid_moves)
+
+    def _ask_llm(self, board, valid_moves, current_player, ml_suggestion):
+        """LLMに問い合わせて応答から読み取った有効な手を返す（読み取れなければNone）"""
+        if self.model_type == "ensemble":
+            requests = [(provider, self._create_prompt(board, valid_moves, current_player, ml_suggestion, provider.name))
+                        for provider in self.providers]
+            move, _ = llm_providers.race(
+                requests,
+                lambda text: self._extract_move_from_response(text, valid_moves),
+                mode=ENSEMBLE_MODE
+            )
+            return move
+
+        prompt = self._create_prompt(board, valid_moves, current_player, ml_suggestion)
+        move_text = llm_providers.complete(self.provider, prompt)
+        # LLMの応答から座標を抽出
+        move = self._extract_move_from_response(move_text, valid_moves)
+        self.provider.record_answer(move is not None)
+        return move
+
+    def _fallback_move(self, game, valid_moves):
+        """LLMが使えないときにローカル探索で手を決める"""
+        if not valid_moves:
+            return None
+        try:
+            move = self.fallback_search.get_game_move(game)
+            if move in valid_moves:
+                return move
+        except Exception as e:
+            print(f"Error in fallback search: {e}")
+        return valid_moves[0]
 
     def _extract_move_from_response(self, move_text, valid_moves):
         """LLMの応答から有効な手を抽出"""
@@ -154,71 +172,23 @@ class LLMHandler:
         except:
             return None
 
-    def _create_prompt(self, board_state, valid_moves, ml_suggestion):
-        if self.model_type == "llama":
-            # Llama用のプロンプトフォーマット
-            base_prompt = f"""<s>[INST] あなたは熟練のオセロプレイヤーです。
-以下のボード状態から最適な手を選んでください。
-
-ボード状態:
-{board_state}
-
-有効な手: {valid_moves}
-
-以下の戦略を考慮してください:
-- 角の確保が最重要
-- 相手に角を取られる手は避ける
-- 安定した石を増やす
-- 相手の動きを予測
-
-必ず「行番号,列番号」の形式で1手だけ返してください。
-例: 2,3 [/INST]"""
-        else:
-            # その他のモデル用のプロンプト
-            base_prompt = f"""あなたは熟練のオセロプレイヤーです。
-以下のボード状態から最適な手を選んでください。
-
-ボード状態:
-{board_state}
-
-有効な手: {valid_moves}
-
-以下の戦略を考慮してください:
-- 角の確保が最重要
-- 相手に角を取られる手は避ける
-- 安定した石を増やす
-- 相手の動きを予測
-
-必ず「行番号,列番号」の形式で1手だけ返してください。
-例: 2,3"""
-
-        if ml_suggestion:
-            ml_hint = f"""
-
-機械学習の分析によると ({ml_suggestion[0]}, {ml_suggestion[1]}) が有望な手です。
-この提案も考慮に入れて最適な手を選んでください。"""
-            return base_prompt + ml_hint
-
-        return base_prompt
-
-    def record_move(self, board, valid_moves, move, current_player):
-        """記録"""
-        if move:
-            self._moves_history.append({
-                'board': board,
-                'valid_moves': valid_moves,
-                'move': move,
-                'player_type': self.model_type,
-                'current_player': current_player
-            })
+    def _create_prompt(self, board, valid_moves, current_player, ml_suggestion, model_type=None):
+        """盤面を手番側から見た1マス1文字の形式にしてテンプレートに埋め込む"""
+        cells = _CELL_CHARS[current_player]
+        board_text = '\n'.join(str(i) + ''.join(cells[cell] for cell in row) for i, row in enumerate(board))
+        template = _PROMPT_TEMPLATES.get(model_type or self.model_type, _PROMPT_TEMPLATES['default'])
+        return template.format(
+            board=board_text,
+            moves=' '.join(f"{row},{col}" for row, col in valid_moves),
+            hint=_ML_HINT.format(*ml_suggestion) if ml_suggestion else ''
+        )
 
     @classmethod
-    def end_game(cls, winner, player_types):
-        """ゲーム終了時の処理"""
-        if cls._moves_history:
-            cls._game_learning.record_game(cls._moves_history, winner, player_types)
-            cls._moves_history = []
-            
+    def end_game(cls, winner, player_types, trajectory):
+        """ゲーム終了時の処理（trajectoryはその対局の着手の記録）"""
+        if len(trajectory):
+            cls._game_learning.record_game(trajectory.to_records(player_types, winner), winner, player_types)
+
             # 戦績を表示
             stats = cls._game_learning.get_strategy_stats()
             print("\n=== 戦績レポート ===")
@@ -231,4 +201,15 @@ class LLMHandler:
     @classmethod
     def get_stats(cls):
         """現在の戦績を取得"""
-        return cls._game_learning.get_strategy_stats()
\ No newline at end of file
+        return cls._game_learning.get_strategy_stats()
+
+    @classmethod
+    def get_metrics(cls):
+        """学習と探索の内部状態（運用監視用）"""
+        return {
+            'training': cls._game_learning.get_training_stats(),
+            'transpositionTable': search.shared_table.stats(),
+            'providers': llm_providers.provider_stats(),
+            'moveCache': cls._move_cache.stats(),
+            'openingBook': {'entries': len(cls._opening_book)}
+        }
\ No newline at end of file
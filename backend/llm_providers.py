@@ -0,0 +1,377 @@
+"""LLMプロバイダーへの非同期リクエスト
+
+全プロバイダーの呼び出しを1本のイベントループ（専用スレッド）で処理する。
+HTTPのセッションはプロバイダーごとに使い回し（keep-alive）、同時リクエスト数も
+プロバイダーごとに制限するので、遅いプロバイダーが他の対局のリクエストを巻き込まない。
+Flaskのリクエストスレッドからは complete() で締め切り付きで結果を待つ。
+"""
+import abc
+import asyncio
+import atexit
+import concurrent.futures
+import os
+import random
+import threading
+import time
+
+import aiohttp
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+DEFAULT_DEADLINE = float(os.getenv("LLM_DEADLINE", "10"))  # 1手あたりの待ち時間の上限（秒）
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))  # プロバイダーごとの同時リクエスト数
+MAX_RETRIES = 2
+BACKOFF_BASE = 0.5  # 再試行までの待ち時間の基準（秒、試行ごとに倍）
+HUGGINGFACE_API_URL = os.getenv("HUGGINGFACE_API_URL", "https://api-inference.huggingface.co/models/")
+
+
+class ProviderError(Exception):
+    """プロバイダーが使える応答を返さなかった（retryableなら再試行で回復しうる）"""
+
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def _is_transient_status(status):
+    # レート制限とサーバー側のエラーだけが時間をおけば回復しうる
+    return status == 429 or status >= 500
+
+
+def _is_retryable(error):
+    """再試行する価値のある一時的な失敗か（キーやリクエストの誤り、応答の解析失敗は再試行しない）"""
+    if isinstance(error, ProviderError):
+        return error.retryable
+    if isinstance(error, aiohttp.ClientResponseError):
+        return _is_transient_status(error.status)
+    if isinstance(error, aiohttp.ClientError):
+        return True
+    if isinstance(error, google_exceptions.GoogleAPICallError):
+        return error.code is not None and _is_transient_status(int(error.code))
+    return False
+
+
+class _LoopThread:
+    """プロバイダー共通のイベントループを動かすスレッド"""
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self._loop.run_forever, name='llm-providers', daemon=True)
+                thread.start()
+            return self._loop
+
+
+_loop_thread = _LoopThread()
+
+
+def submit(coro):
+    """コルーチンを共通のイベントループに投入してconcurrent.futures.Futureを返す"""
+    return asyncio.run_coroutine_threadsafe(coro, _loop_thread.get())
+
+
+def complete(provider, prompt, deadline=None):
+    """同期的にプロバイダーの応答を待つ（締め切りを過ぎたら取り消してTimeoutError）"""
+    timeout = DEFAULT_DEADLINE if deadline is None else deadline
+    future = submit(provider.complete(prompt, timeout))
+    try:
+        # 締め切りはループ側でも管理しているので、少しだけ余裕を持って待つ
+        return future.result(timeout + 0.5)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise TimeoutError(f"{provider.name} did not answer within {timeout}s")
+
+
+def race(requests, parse, deadline=None, mode='race'):
+    """複数のプロバイダーに同時に問い合わせて1手を決める
+
+    requestsは (プロバイダー, プロンプト) のリスト、parseは応答テキストから有効な手（なければNone）を返す関数。
+    mode='race' は最初に得られた有効な手、mode='vote' は締め切りまでの多数決（同数なら先に届いた手）。
+    手が決まった時点で残りのリクエストは取り消す。(手, 採用したプロバイダー名) を返す。
+    """
+    timeout = DEFAULT_DEADLINE if deadline is None else deadline
+    future = submit(_race(requests, parse, timeout, mode))
+    try:
+        return future.result(timeout + 0.5)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        return None, None
+
+
+async def _race(requests, parse, timeout, mode):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    tasks = {asyncio.ensure_future(provider.complete(prompt, timeout)): provider
+             for provider, prompt in requests}
+    pending = set(tasks)
+    votes = {}  # 手 -> 採用したプロバイダー名のリスト（届いた順）
+    try:
+        while pending:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                provider = tasks[task]
+                if task.cancelled() or task.exception() is not None:
+                    continue
+                move = parse(task.result())
+                provider.record_answer(move is not None)
+                if move is None:
+                    continue
+                if mode != 'vote':
+                    return move, provider.name
+                votes.setdefault(move, []).append(provider.name)
+            if votes:
+                # 残りの応答がすべて2位の手に入っても逆転できなければ待たない
+                counts = sorted((len(names) for names in votes.values()), reverse=True)
+                runner_up = counts[1] if len(counts) > 1 else 0
+                if counts[0] > runner_up + len(pending):
+                    break
+    finally:
+        for task in pending:
+            task.cancel()
+
+    if not votes:
+        return None, None
+    move = max(votes, key=lambda m: len(votes[m]))  # 同数なら先に届いた手（dictは挿入順）
+    return move, votes[move][0]
+
+
+class LLMProvider(abc.ABC):
+    """締め切り・同時実行数の制限・再試行を共通で扱う基底クラス"""
+
+    name = 'base'
+
+    def __init__(self, concurrency=MAX_CONCURRENCY):
+        self.concurrency = concurrency
+        self._semaphore = None
+        self._session = None
+        self.requests = 0
+        self.successes = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.retries = 0
+        self.cancelled = 0
+        self.valid_answers = 0  # 応答から有効な手を読み取れた回数
+        self.invalid_answers = 0
+        self.total_latency = 0.0
+
+    @property
+    def semaphore(self):
+        # セマフォはイベントループ上で作る
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def session(self):
+        """keep-aliveで使い回すHTTPセッション"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    @abc.abstractmethod
+    async def _generate(self, prompt):
+        """プロンプトに対する応答テキストを返す（プロバイダーごとに実装する）"""
+
+    async def _attempt(self, prompt):
+        async with self.semaphore:
+            text = await self._generate(prompt)
+        if not text:
+            raise ProviderError(f"Empty response from {self.name}")
+        return text
+
+    async def complete(self, prompt, timeout):
+        """timeout秒以内に応答テキストを返す（失敗したら締め切りまで指数バックオフで再試行）"""
+        self.requests += 1
+        start = time.perf_counter()
+        try:
+            text = await self._complete(prompt, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        except asyncio.CancelledError:
+            # 合議で他のプロバイダーの応答が先に採用された
+            self.cancelled += 1
+            raise
+        except Exception:
+            self.failures += 1
+            raise
+        self.successes += 1
+        self.total_latency += time.perf_counter() - start
+        return text
+
+    async def _complete(self, prompt, timeout):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        attempt = 0
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            try:
+                return await asyncio.wait_for(self._attempt(prompt), remaining)
+            except asyncio.TimeoutError:
+                raise
+            except Exception as e:
+                if not _is_retryable(e):
+                    raise
+                attempt += 1
+                delay = BACKOFF_BASE * 2 ** (attempt - 1) * (1 + random.random() / 2)
+                if attempt > MAX_RETRIES or loop.time() + delay >= deadline:
+                    raise
+                self.retries += 1
+                await asyncio.sleep(delay)
+
+    def record_answer(self, valid):
+        if valid:
+            self.valid_answers += 1
+        else:
+            self.invalid_answers += 1
+
+    def stats(self):
+        answers = self.valid_answers + self.invalid_answers
+        return {
+            'requests': self.requests,
+            'successes': self.successes,
+            'timeouts': self.timeouts,
+            'failures': self.failures,
+            'retries': self.retries,
+            'cancelled': self.cancelled,
+            'valid_rate': round(self.valid_answers / answers, 4) if answers else None,
+            'avg_latency': round(self.total_latency / self.successes, 4) if self.successes else None
+        }
+
+
+class GeminiProvider(LLMProvider):
+    name = 'gemini'
+
+    def __init__(self, api_key, **kwargs):
+        super().__init__(**kwargs)
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel('gemini-pro')
+
+    async def _generate(self, prompt):
+        # SDKのgRPCチャネルは接続を使い回す
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+
+class LlamaProvider(LLMProvider):
+    name = 'llama'
+
+    def __init__(self, api_key, model="meta-llama/Llama-3-8b-instruct", **kwargs):
+        super().__init__(**kwargs)
+        self.url = HUGGINGFACE_API_URL + model
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+
+    async def _generate(self, prompt):
+        session = await self.session()
+        data = {
+            "inputs": prompt,
+            "parameters": {
+                "max_new_tokens": 50,
+                "temperature": 0.7,
+                "top_p": 0.9,
+                "repetition_penalty": 1.1,
+                "do_sample": True,
+                "return_full_text": False
+            }
+        }
+        async with session.post(self.url, headers=self.headers, json=data) as response:
+            if response.status != 200:
+                raise ProviderError(f"API returned status {response.status}",
+                                    retryable=_is_transient_status(response.status))
+            result = await response.json()
+        if isinstance(result, list) and result:
+            result = result[0]
+        return (result.get("generated_text") or "").strip()
+
+
+class DifyProvider(LLMProvider):
+    name = 'dify'
+
+    def __init__(self, api_key, api_endpoint, **kwargs):
+        super().__init__(**kwargs)
+        self.url = f"{api_endpoint.rstrip('/')}/chat-messages"
+        self.headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+
+    async def _generate(self, prompt):
+        session = await self.session()
+        data = {
+            "query": prompt,
+            "response_mode": "blocking",
+            "conversation_id": "",
+            "user": "user"
+        }
+        async with session.post(self.url, headers=self.headers, json=data) as response:
+            if response.status != 200:
+                raise ProviderError(f"API returned status {response.status}",
+                                    retryable=_is_transient_status(response.status))
+            response_data = await response.json()
+        return response_data.get("answer", "")
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_provider(model_type):
+    """プロバイダーを取得（プロセス内で共有し、セッションと同時実行数の制限を全対局で共有する）"""
+    with _providers_lock:
+        if model_type not in _providers:
+            _providers[model_type] = _create_provider(model_type)
+        return _providers[model_type]
+
+
+def provider_stats():
+    """作成済みプロバイダーごとのリクエスト統計"""
+    with _providers_lock:
+        return {name: provider.stats() for name, provider in _providers.items()}
+
+
+@atexit.register
+def _close_providers():
+    """終了時にkeep-aliveの接続を閉じる"""
+    if _loop_thread._loop is None:
+        return
+    for provider in list(_providers.values()):
+        try:
+            submit(provider.close()).result(1)
+        except Exception as e:
+            print(f"Error closing {provider.name} session: {e}")
+
+
+def _create_provider(model_type):
+    """APIキーの存在を確認し、なければValueErrorを発生"""
+    if model_type == "gemini":
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise ValueError("Gemini API key not found. Please set GOOGLE_API_KEY in .env file")
+        return GeminiProvider(api_key)
+    if model_type == "llama":
+        api_key = os.getenv("HUGGINGFACE_API_KEY")
+        if not api_key:
+            raise ValueError("Hugging Face API key not found. Please set HUGGINGFACE_API_KEY in .env file")
+        return LlamaProvider(api_key)
+    if model_type == "dify":
+        api_key = os.getenv("DIFY_API_KEY")
+        api_endpoint = os.getenv("DIFY_API_ENDPOINT")
+        if not api_key or not api_endpoint:
+            raise ValueError("Dify API credentials not found. Please set DIFY_API_KEY and DIFY_API_ENDPOINT in .env file")
+        return DifyProvider(api_key, api_endpoint)
+    raise ValueError(f"Unknown model type: {model_type}")
@@ -1,111 +1,275 @@
+import copy
+import threading
 import numpy as np
 from sklearn.ensemble import RandomForestClassifier
-from datetime import datetime
+from compiled_forest import CompiledForest
+from model_store import ModelStore
+from replay_buffer import ReplayBuffer
+from training_worker import TrainingWorker
+from game_records import RecordReader, RecordWriter, records_from_moves, model_index
+import bitboard
+import patterns
+import symmetry
+
+FEATURE_VERSION = 2  # 特徴量の構成を変えたら上げる（保存済みモデルが使えなくなる）
+N_FEATURES = 82
+
+# 追加学習の設定（1局ごとの学習コストを履歴の長さによらず一定に保つ）
+REPLAY_CAPACITY = 20000  # モデルごとに保持する過去の局面数
+TREES_PER_GAME = 10  # 1局ごとに追加する木の数
+MAX_TREES = 100  # これを超えたら古い木から捨てる
+AUGMENT_SYMMETRIES = True  # 学習時に盤面の8通りの対称変換で例を増やす
+PATTERN_DISC_SCALE = 8.0  # パターン評価の予測石差を0〜1の位置スコアに変換するときの尺度
+
+# 各マスの重要度（角を最重視し、角の隣は不利とする）
+IMPORTANCE_MAP = np.array([
+    [120, -20, 20, 5, 5, 20, -20, 120],
+    [-20, -40, -5, -5, -5, -5, -40, -20],
+    [20, -5, 15, 3, 3, 15, -5, 20],
+    [5, -5, 3, 3, 3, 3, -5, 5],
+    [5, -5, 3, 3, 3, 3, -5, 5],
+    [20, -5, 15, 3, 3, 15, -5, 20],
+    [-20, -40, -5, -5, -5, -5, -40, -20],
+    [120, -20, 20, 5, 5, 20, -20, 120]
+])
+
+_CORNER_ROWS = np.array([0, 0, 7, 7])
+_CORNER_COLS = np.array([0, 7, 0, 7])
+_EDGE_ROWS = np.array([0, 0, 1, 1, 6, 6, 7, 7])
+_EDGE_COLS = np.array([1, 6, 0, 7, 0, 7, 1, 6])
+
+
+_BIT_POSITIONS = np.arange(64, dtype=np.uint64)
+
+# 対称変換ごとの特徴量の列の並び（盤面の64列だけを並べ替え、残りは対称変換で値が変わらない）
+_FEATURE_PERMUTATIONS = np.tile(np.arange(N_FEATURES), (8, 1))
+_FEATURE_PERMUTATIONS[:, :64] = symmetry.BOARD_PERMUTATIONS
+
+
+def _augment(X, y):
+    """リプレイバッファの例を8通りの向きに展開する（バッファには元の向きだけを保持）"""
+    X = np.asarray(X, dtype=np.float32)[:, _FEATURE_PERMUTATIONS]
+    return X.reshape(-1, X.shape[-1]), np.repeat(y, 8)
+
+
+def _boards_from_bitboards(black, white):
+    """ビットボードの列から (N, 8, 8) の盤面配列を作る"""
+    black_bits = (np.asarray(black, dtype=np.uint64).reshape(-1, 1) >> _BIT_POSITIONS) & np.uint64(1)
+    white_bits = (np.asarray(white, dtype=np.uint64).reshape(-1, 1) >> _BIT_POSITIONS) & np.uint64(1)
+    boards = black_bits.astype(np.int64) * 2 + white_bits.astype(np.int64)
+    return boards.reshape(-1, 8, 8)
+
+
+def _bitboards_from_masks(mask):
+    """(N, 8, 8) の真偽値配列から (N,) のビットボードを作る"""
+    bits = mask.reshape(len(mask), 64).astype(np.uint64) << _BIT_POSITIONS
+    return np.bitwise_or.reduce(bits, axis=1)
+
+
+def _popcounts(x):
+    """ビットボードの配列の各要素の立っているビットの数"""
+    return ((x.reshape(-1, 1) >> _BIT_POSITIONS) & np.uint64(1)).sum(axis=1)
+
+
+def _neighbour_counts(mask):
+    """各マスについて8近傍でmaskが立っているマスの数を数える"""
+    padded = np.pad(mask.astype(np.int8), ((0, 0), (1, 1), (1, 1)))
+    counts = np.zeros(mask.shape, dtype=np.int8)
+    for dx in (0, 1, 2):
+        for dy in (0, 1, 2):
+            if dx != 1 or dy != 1:
+                counts += padded[:, dx:dx + 8, dy:dy + 8]
+    return counts
+
+
+def _max_cluster_sizes(mask):
+    """各盤面でmaskの8連結成分のうち最大のものの大きさを返す"""
+    n = len(mask)
+    # 各マスに番号を振り、近傍の最大値を伝播させて連結成分ごとに番号を揃える
+    labels = np.where(mask, np.arange(1, 65).reshape(1, 8, 8), 0)
+    while True:
+        padded = np.pad(labels, ((0, 0), (1, 1), (1, 1)))
+        spread = labels
+        for dx in (0, 1, 2):
+            for dy in (0, 1, 2):
+                spread = np.maximum(spread, padded[:, dx:dx + 8, dy:dy + 8])
+        spread = np.where(mask, spread, 0)
+        if np.array_equal(spread, labels):
+            break
+        labels = spread
+
+    offsets = (np.arange(n) * 65).reshape(n, 1, 1)
+    counts = np.bincount((labels + offsets).ravel(), minlength=n * 65).reshape(n, 65)
+    counts[:, 0] = 0  # 番号0は石のないマス
+    return counts.max(axis=1)
+
 
 class GameLearning:
-    def __init__(self):
+    def __init__(self, use_compiled_inference=True, store=None, background_training=True):
         # 各モデル用の学習器を初期化
         self.models = {
             'gemini': RandomForestClassifier(n_estimators=100, random_state=42),
             'llama': RandomForestClassifier(n_estimators=100, random_state=42),
             'dify': RandomForestClassifier(n_estimators=100, random_state=42)
         }
-        self.game_history = []
         self.win_rates = {
             'gemini': {'wins': 0, 'total': 0},
             'llama': {'wins': 0, 'total': 0},
-            'dify': {'wins': 0, 'total': 0}
+            'dify': {'wins': 0, 'total': 0},
+            'search': {'wins': 0, 'total': 0},
+            'ensemble': {'wins': 0, 'total': 0}
         }
+        # リクエスト時はsklearnを経由せず平坦化した木で推論する
+        self.use_compiled_inference = use_compiled_inference
+        self._compiled = {}  # model_type -> (元のモデル, CompiledForest)
+        self.replay_buffers = {}  # model_type -> ReplayBuffer
+        # 保存済みの学習結果は初めて使うときに読み込む
+        self.store = store if store is not None else ModelStore()
+        self._loaded_models = set()
+        self._stats_loaded = False
+        # 学習はリクエストを処理するスレッドとは別のスレッドで行う
+        self._lock = threading.Lock()  # win_ratesの更新用
+        # 保存済みの学習結果の読み込み用（読み込み終わる前に他のスレッドが未学習のまま使わないようにする）
+        self._load_lock = threading.Lock()
+        # 対局の記録はメモリに持たず、固定長レコードとしてファイルに追記する
+        self.records = RecordWriter(self.store.records_directory)
+        self.worker = TrainingWorker(self) if background_training else None
+
+    def _ensure_model(self, model_type):
+        """保存済みモデルを初回使用時に読み込む"""
+        if model_type in self._loaded_models:
+            return
+        with self._load_lock:
+            if model_type in self._loaded_models:
+                return
+            loaded = self.store.load_model(model_type, FEATURE_VERSION, N_FEATURES)
+            if loaded is not None:
+                model = loaded['model']
+                self.models[model_type] = model
+                if loaded['compiled'] is not None:
+                    self._compiled[model_type] = (model, CompiledForest.from_arrays(loaded['compiled']))
+                if loaded['replay'] is not None:
+                    self.replay_buffers[model_type] = ReplayBuffer.from_arrays(
+                        loaded['replay'], REPLAY_CAPACITY, N_FEATURES)
+            # 読み込んだ結果を反映してから読み込み済みにする
+            self._loaded_models.add(model_type)
+
+    def _replay_buffer(self, model_type):
+        if model_type not in self.replay_buffers:
+            self.replay_buffers[model_type] = ReplayBuffer(REPLAY_CAPACITY, N_FEATURES)
+        return self.replay_buffers[model_type]
+
+    def _ensure_stats(self):
+        """保存済みの勝率を初回使用時に読み込む"""
+        if self._stats_loaded:
+            return
+        with self._load_lock:
+            if self._stats_loaded:
+                return
+            for llm_type, rates in self.store.load_win_rates().items():
+                self.win_rates[llm_type] = rates
+            self._migrate_history()
+            self._stats_loaded = True
+
+    def _migrate_history(self):
+        """旧形式の対局履歴（game_history.joblib）を一度だけレコード形式に変換する"""
+        if len(RecordReader(self.store.records_directory)):
+            return
+        for game in self.store.load_history():
+            try:
+                self.records.append(records_from_moves(game['moves'], game['winner']))
+            except Exception as e:
+                print(f"Error converting game history: {e}")
+
+    def save(self, model_types=()):
+        """学習結果を保存（モデルは指定されたものだけ書き出す）"""
+        # 保存済みの勝率を読み込む前に上書きしないようにする
+        self._ensure_stats()
+        try:
+            for model_type in model_types:
+                model = self.models[model_type]
+                cached = self._compiled.get(model_type)
+                if cached is None or cached[0] is not model:
+                    cached = (model, CompiledForest.from_sklearn(model))
+                    self._compiled[model_type] = cached
+                self.store.save_model(model_type, model, FEATURE_VERSION, cached[1].to_arrays(),
+                                      self._replay_buffer(model_type).to_arrays())
+            with self._lock:
+                win_rates = copy.deepcopy(self.win_rates)
+            self.store.save_win_rates(win_rates)
+        except Exception as e:
+            print(f"Error saving models: {e}")
 
     def _extract_features(self, board, valid_moves, current_player):
         """ボード状態から特徴量を抽出"""
-        features = []
-        board_array = np.array(board)
-        
+        return self._extract_features_batch([board], [len(valid_moves)], current_player)[0]
+
+    def _extract_features_batch(self, boards, mobility, current_player):
+        """(N, 8, 8) の盤面から (N, F) の特徴量行列をまとめて抽出
+
+        mobilityは各盤面の有効手の数、current_playerは全盤面共通の値か長さNの配列。
+        """
+        boards = np.asarray(boards).reshape(-1, 8, 8)
+        n = len(boards)
+        player = np.broadcast_to(np.asarray(current_player).reshape(-1), (n,)).reshape(n, 1, 1)
+        mine = boards == player
+        theirs = boards == (3 - player)
+        empty = boards == 0
+
         # 1. 基本的なボード情報
-        features.extend(board_array.flatten())
-        
+        board_info = boards.reshape(n, 64)
+
         # 2. 局面の評価値
-        importance_map = np.array([
-            [120, -20, 20, 5, 5, 20, -20, 120],
-            [-20, -40, -5, -5, -5, -5, -40, -20],
-            [20, -5, 15, 3, 3, 15, -5, 20],
-            [5, -5, 3, 3, 3, 3, -5, 5],
-            [5, -5, 3, 3, 3, 3, -5, 5],
-            [20, -5, 15, 3, 3, 15, -5, 20],
-            [-20, -40, -5, -5, -5, -5, -40, -20],
-            [120, -20, 20, 5, 5, 20, -20, 120]
-        ])
-        position_score = np.sum(board_array * importance_map)
-        features.append(position_score)
-        
+        position_score = (boards * IMPORTANCE_MAP).sum(axis=(1, 2))
+
         # 3. 局面の支配状況
-        player_stones = np.sum(board_array == current_player)
-        opponent_stones = np.sum(board_array == (3 - current_player))
-        stone_ratio = player_stones / (player_stones + opponent_stones) if (player_stones + opponent_stones) > 0 else 0.5
-        features.extend([player_stones, opponent_stones, stone_ratio])
-        
+        player_stones = mine.sum(axis=(1, 2))
+        opponent_stones = theirs.sum(axis=(1, 2))
+        total_stones = player_stones + opponent_stones
+        stone_ratio = np.where(total_stones > 0, player_stones / np.maximum(total_stones, 1), 0.5)
+
         # 4. モビリティ（有効手の数）と相対的なモビリティ
-        mobility = len(valid_moves)
+        mobility = np.broadcast_to(np.asarray(mobility, dtype=float).reshape(-1), (n,))
         relative_mobility = mobility / 32  # 最大32手で正規化
-        features.extend([mobility, relative_mobility])
-        
+
         # 5. 盤面の安定性分析
-        corners = [board[0][0], board[0][7], board[7][0], board[7][7]]
-        edges = [board[i][j] for i, j in [(0,1), (0,6), (1,0), (1,7), (6,0), (6,7), (7,1), (7,6)]]
-        
-        corner_control = sum(1 for c in corners if c == current_player)
-        opponent_corner = sum(1 for c in corners if c == (3 - current_player))
-        edge_control = sum(1 for e in edges if e == current_player)
-        features.extend([corner_control, opponent_corner, edge_control])
-        
+        corner_control = mine[:, _CORNER_ROWS, _CORNER_COLS].sum(axis=1)
+        opponent_corner = theirs[:, _CORNER_ROWS, _CORNER_COLS].sum(axis=1)
+        edge_control = mine[:, _EDGE_ROWS, _EDGE_COLS].sum(axis=1)
+
         # 6. パリティ（手番の優位性）
-        total_empty = np.sum(board_array == 0)
-        parity = 1 if total_empty % 2 == 0 else -1
-        features.append(parity)
-        
-        # 7. 盤面のクラスター分析
-        clusters = self._analyze_clusters(board_array, current_player)
-        features.extend([clusters['size'], clusters['boundary']])
-        
-        return np.array(features)
-
-    def _analyze_clusters(self, board, player):
-        def find_cluster(x, y, visited):
-            if (x, y) in visited or not (0 <= x < 8 and 0 <= y < 8):
-                return 0, 0
-            if board[x][y] != player:
-                return 0, 0
-                
-            visited.add((x, y))
-            size = 1
-            boundary = 0
-            
-            # 隣接マスをチェック
-            for dx, dy in [(-1,-1), (-1,0), (-1,1), (0,-1), (0,1), (1,-1), (1,0), (1,1)]:
-                nx, ny = x + dx, y + dy
-                if 0 <= nx < 8 and 0 <= ny < 8:
-                    if board[nx][ny] == 0:
-                        boundary += 1
-                    elif board[nx][ny] == player and (nx, ny) not in visited:
-                        s, b = find_cluster(nx, ny, visited)
-                        size += s
-                        boundary += b
-                        
-            return size, boundary
-
-        visited = set()
-        max_cluster_size = 0
-        total_boundary = 0
-        
-        for i in range(8):
-            for j in range(8):
-                if board[i][j] == player and (i, j) not in visited:
-                    size, boundary = find_cluster(i, j, visited)
-                    max_cluster_size = max(max_cluster_size, size)
-                    total_boundary += boundary
-                    
-        return {'size': max_cluster_size, 'boundary': total_boundary}
+        parity = np.where(empty.sum(axis=(1, 2)) % 2 == 0, 1, -1)
+
+        # 7. 盤面のクラスター分析（最大の連結成分の大きさと、空きマスに接する境界の数）
+        cluster_size = _max_cluster_sizes(mine)
+        boundary = (mine * _neighbour_counts(empty)).sum(axis=(1, 2))
+
+        # 8. 確定石・空きマスに接する石・潜在的な着手可能数（ビットボードの配列でまとめて計算）
+        # 自分と相手の分を並べて1回ずつ計算する
+        mine_bits = _bitboards_from_masks(mine)
+        theirs_bits = _bitboards_from_masks(theirs)
+        first = np.concatenate([mine_bits, theirs_bits])
+        second = np.concatenate([theirs_bits, mine_bits])
+        counts = _popcounts(np.concatenate([
+            bitboard.stable_discs(first, second),
+            bitboard.frontier_discs(first, second),
+            bitboard.potential_mobility(first, second)
+        ])).reshape(6, n)
+        player_stable, opponent_stable = counts[0], counts[1]
+        player_frontier, opponent_frontier = counts[2], counts[3]
+        potential_mobility, opponent_potential_mobility = counts[4], counts[5]
+
+        return np.column_stack([
+            board_info, position_score,
+            player_stones, opponent_stones, stone_ratio,
+            mobility, relative_mobility,
+            corner_control, opponent_corner, edge_control,
+            parity,
+            cluster_size, boundary,
+            player_stable, opponent_stable,
+            player_frontier, opponent_frontier,
+            potential_mobility, opponent_potential_mobility
+        ]).astype(float)
 
     def get_move_suggestion(self, model_type, board, valid_moves, current_player):
         """学習した戦略に基づいて手を提案"""
@@ -113,24 +277,38 @@ class GameLearning:
             return None
             
         try:
-            features = self._extract_features(board, valid_moves, current_player)
             move_scores = []
+
+            # 各候補を実際に打って石を裏返した局面を作り、特徴量を一括で抽出
+            black, white = bitboard.from_board(board)
+            player, opponent = (black, white) if current_player == 2 else (white, black)
+            children = [bitboard.play(player, opponent, row * 8 + col) for row, col in valid_moves]
+            # 打った後の局面での自分の有効手の数
+            child_mobility = [bitboard.popcount(bitboard.legal_moves(p, o)) for p, o in children]
+            movers = [p for p, _ in children]
+            others = [o for _, o in children]
+            if current_player == 2:
+                temp_boards = _boards_from_bitboards(movers, others)
+            else:
+                temp_boards = _boards_from_bitboards(others, movers)
+            all_features = self._extract_features_batch(temp_boards, child_mobility, current_player)
             
-            for move in valid_moves:
-                # 仮想的に手を打った状態の評価
-                temp_board = [row[:] for row in board]
-                temp_board[move[0]][move[1]] = current_player
-                move_features = self._extract_features(temp_board, valid_moves, current_player)
-                
+            # 全候補をまとめて1回で推論
+            model_scores = self._win_probabilities(model_type, all_features)
+            pattern_scores = self._pattern_scores(player, opponent, valid_moves, children)
+            
+            for i, (move, temp_board) in enumerate(zip(valid_moves, temp_boards)):
                 # 戦略的評価を組み合わせる
-                position_score = self._evaluate_position(move[0], move[1], temp_board)
+                if pattern_scores is not None:
+                    position_score = pattern_scores[i]
+                else:
+                    position_score = self._evaluate_position(move[0], move[1], temp_board)
                 
-                try:
-                    model_score = self.models[model_type].predict_proba([move_features])[0][1]
+                if model_scores is not None:
                     # モデルスコアと位置スコアを組み合わせる
-                    combined_score = 0.7 * model_score + 0.3 * position_score
+                    combined_score = 0.7 * model_scores[i] + 0.3 * position_score
                     move_scores.append((move, combined_score))
-                except:
+                else:
                     # モデルが未学習の場合は位置スコアのみを使用
                     move_scores.append((move, position_score))
             
@@ -145,6 +323,42 @@ class GameLearning:
             print(f"Error in get_move_suggestion: {e}")
             return valid_moves[0] if valid_moves else None
 
+    def _pattern_scores(self, player, opponent, valid_moves, children):
+        """パターン評価による各候補の位置スコア（0〜1、重みが未学習ならNone）"""
+        evaluator = patterns.shared_evaluator
+        if evaluator is None:
+            return None
+        # 打つ前の局面の添字から、置いたマスと裏返った石の分だけ差分で更新する
+        root = patterns.indices(player, opponent)
+        squares = [row * 8 + col for row, col in valid_moves]
+        flipped = [p & ~player & ~(1 << square) for (p, _), square in zip(children, squares)]
+        child_indices = patterns.update_indices(root, squares, flipped, 1)
+        discs = np.full(len(children), bitboard.popcount(player | opponent) + 1)
+        # 打った後は相手の手番なので、相手から見た添字で評価して符号を反転する
+        mobility = patterns.mobility_diff([o for _, o in children], [p for p, _ in children])
+        values = -evaluator.evaluate_indices(patterns.SWAP[child_indices], discs, mobility)
+        return 1.0 / (1.0 + np.exp(-values / PATTERN_DISC_SCALE))
+
+    def _win_probabilities(self, model_type, X):
+        """各行の勝ちクラスの確率を返す（モデルが使えない場合はNone）"""
+        self._ensure_model(model_type)
+        model = self.models.get(model_type)
+        if model is None or not hasattr(model, 'estimators_') or len(model.classes_) < 2:
+            return None
+        try:
+            if not self.use_compiled_inference:
+                return model.predict_proba(X)[:, 1]
+
+            cached = self._compiled.get(model_type)
+            if cached is None or cached[0] is not model:
+                # 再学習でモデルが入れ替わったときだけ変換し直す
+                cached = (model, CompiledForest.from_sklearn(model))
+                self._compiled[model_type] = cached
+            return cached[1].predict_proba(X)[:, 1]
+        except Exception as e:
+            print(f"Error in model inference for {model_type}: {e}")
+            return None
+
     def _evaluate_position(self, row, col, board):
         """位置の価値を評価（局面に応じて動的に調整）"""
         score = 0.0
@@ -171,74 +385,144 @@ class GameLearning:
         
         return score
 
-    def record_game(self, moves_history, winner, player_types):
-        """ゲームの結果を記録して即座に学習"""
-        self.game_history.append({
-            'moves': moves_history,
+    def record_game(self, records, winner, player_types):
+        """ゲームの結果（1局分のレコード配列）を記録し、学習を依頼する（バックグラウンド学習時はすぐに戻る）"""
+        self._ensure_stats()
+        game = {
+            'records': records,
             'winner': winner,
-            'players': player_types,
-            'timestamp': datetime.now()
-        })
-        
-        # 勝率の更新
-        winner_type = player_types[winner - 1] if winner > 0 else None
-        for llm_type in player_types:
-            self.win_rates[llm_type]['total'] += 1
-            if llm_type == winner_type:
-                self.win_rates[llm_type]['wins'] += 1
-
-        # 即座に学習を実行
-        self.learn_from_history()
-
-    def learn_from_history(self):
-        """ゲーム履歴から学習"""
-        # 最新のゲームから学習
-        latest_game = self.game_history[-1]
+            'players': player_types
+        }
+        try:
+            self.records.append(game['records'])
+        except Exception as e:
+            print(f"Error writing game records: {e}")
         
+        with self._lock:
+            # 勝率の更新
+            winner_type = player_types[winner - 1] if winner > 0 else None
+            for llm_type in player_types:
+                rates = self.win_rates.setdefault(llm_type, {'wins': 0, 'total': 0})
+                rates['total'] += 1
+                if llm_type == winner_type:
+                    rates['wins'] += 1
+
+        if self.worker is not None:
+            self.worker.submit(game)
+        else:
+            self.train_games([game])
+
+    def train_games(self, games):
+        """対局をまとめて学習して保存し、学習したモデルの種類を返す"""
+        # 対局ごとのレコード配列（arenaなどから手のリストで渡された対局は変換する）
+        records = [game['records'] if 'records' in game else records_from_moves(game['moves'], game['winner'])
+                   for game in games]
+        records = np.concatenate(records) if records else None
+        trained = []
         for llm_type in ['gemini', 'llama', 'dify']:
-            if llm_type in latest_game['players']:
-                X = []
-                y = []
-                
-                player_idx = latest_game['players'].index(llm_type)
-                is_winner = latest_game['winner'] == player_idx + 1
-                
-                for move in latest_game['moves']:
-                    if move['player_type'] == llm_type:
-                        try:
-                            features = self._extract_features(
-                                move['board'],
-                                move['valid_moves'],
-                                move['current_player']
-                            )
-                            X.append(features)
-                            # 勝敗に応じて報酬を設定
-                            y.append(1.0 if is_winner else 0.0)
-                        except Exception as e:
-                            print(f"Error extracting features: {e}")
-                            continue
-                
-                if X and y:
-                    try:
-                        X = np.array(X)
-                        y = np.array(y)
-                        
-                        # 既存のモデルを更新
-                        if hasattr(self.models[llm_type], 'n_features_in_'):
-                            self.models[llm_type].fit(X, y)
-                        else:
-                            # 初めての学習
-                            self.models[llm_type] = RandomForestClassifier(
-                                n_estimators=100, 
-                                random_state=42
-                            ).fit(X, y)
-                            
-                    except Exception as e:
-                        print(f"Error training model for {llm_type}: {e}")
+            if records is None or not self._add_to_replay_buffer(llm_type, records):
+                continue
+            if self._train_model(llm_type):
+                trained.append(llm_type)
+
+        self.save(trained)
+        return trained
+
+    def learn_from_history(self, reader=None):
+        """保存済みの対局レコードからリプレイバッファを作り直して学習し、学習したモデルの種類を返す"""
+        reader = reader or RecordReader(self.store.records_directory)
+        trained = []
+        for llm_type in ['gemini', 'llama', 'dify']:
+            self._ensure_model(llm_type)
+            self.replay_buffers[llm_type] = ReplayBuffer(REPLAY_CAPACITY, N_FEATURES)
+            # リプレイバッファに入りきる最新の分だけを読む
+            if self._add_to_replay_buffer(llm_type, reader.tail(REPLAY_CAPACITY, llm_type)) \
+                    and self._train_model(llm_type):
+                trained.append(llm_type)
+        self.save(trained)
+        return trained
+
+    def _train_model(self, llm_type):
+        try:
+            model = self._train_incremental(llm_type)
+            if model is None:
+                return False
+            # 推論用の変換も済ませてから新しいモデルに差し替える
+            compiled = CompiledForest.from_sklearn(model)
+            self._compiled[llm_type] = (model, compiled)
+            self.models[llm_type] = model
+            return True
+        except Exception as e:
+            print(f"Error training model for {llm_type}: {e}")
+            return False
+
+    def _add_to_replay_buffer(self, llm_type, records):
+        """レコードのうちこのモデルの手をリプレイバッファに加える（加えた手があればTrue）"""
+        records = records[records['model'] == model_index(llm_type)]
+        if not len(records):
+            return False
+        self._ensure_model(llm_type)
+        try:
+            # このモデルの手をまとめて特徴量に変換
+            X = self._extract_features_batch(
+                _boards_from_bitboards(records['black'], records['white']),
+                records['mobility'],
+                records['player']
+            )
+            # 手を打った側が勝ったかどうかを報酬にする
+            y = (records['result'] == 1).astype(float)
+            self._replay_buffer(llm_type).add(X, y)
+            return True
+        except Exception as e:
+            print(f"Error extracting features for {llm_type}: {e}")
+            return False
+
+    def _train_incremental(self, model_type):
+        """リプレイバッファから木を追加した新しいモデルを作る（元のモデルは変更しない）"""
+        X, y = self._replay_buffer(model_type).arrays()
+        if len(np.unique(y)) < 2:
+            # 勝ちと負けの両方の例が揃うまでは学習しない
+            return None
+        # 1本の木が見る例の数は元の局面数のままにして、学習時間を増やさない
+        max_samples = len(X)
+        if AUGMENT_SYMMETRIES:
+            X, y = _augment(X, y)
+
+        current = self.models.get(model_type)
+        if current is not None and hasattr(current, 'estimators_') and len(current.classes_) == 2:
+            # 既存の木はそのまま残し、追加分の木だけを学習する
+            model = copy.copy(current)
+            model.estimators_ = list(current.estimators_)
+            model.warm_start = True
+            model.n_estimators = len(model.estimators_) + TREES_PER_GAME
+            model.max_samples = max_samples
+            model.fit(X, y)
+            if len(model.estimators_) > MAX_TREES:
+                model.estimators_ = model.estimators_[-MAX_TREES:]
+                model.n_estimators = MAX_TREES
+            return model
+
+        return RandomForestClassifier(
+            n_estimators=TREES_PER_GAME,
+            max_samples=max_samples,
+            warm_start=True,
+            random_state=42
+        ).fit(X, y)
+
+    def get_training_stats(self):
+        """バックグラウンド学習の状況（待ち行列の長さと直近の学習時間）"""
+        if self.worker is None:
+            return {'background': False}
+        stats = self.worker.stats()
+        stats['background'] = True
+        return stats
 
     def get_strategy_stats(self):
+        self._ensure_stats()
+        for llm_type in self.models:
+            self._ensure_model(llm_type)
         stats = {}
-        for llm_type in ['gemini', 'llama', 'dify']:
+        for llm_type in list(self.win_rates):
             wins = self.win_rates[llm_type]['wins']
             total = self.win_rates[llm_type]['total']
             win_rate = (wins / total * 100) if total > 0 else 0
@@ -247,7 +531,7 @@ class GameLearning:
                 'games_played': total,
                 'wins': wins,
                 'win_rate': round(win_rate, 2),
-                'model_trained': hasattr(self.models[llm_type], 'n_features_in_')
+                'model_trained': llm_type in self.models and hasattr(self.models[llm_type], 'n_features_in_')
             }
         
         return stats
\ No newline at end of file
@@ -0,0 +1,91 @@
+import os
+import tempfile
+
+import joblib
+from sklearn.ensemble import RandomForestClassifier
+
+MODEL_FORMAT_VERSION = 2  # 保存形式を変えたら上げる（1は推定器をそのまま保存していた旧形式）
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+
+
+class ModelStore:
+    """学習済みモデルと勝率をmodels/以下に保存して読み込む（対局の記録は models/records/ に追記する）
+
+    書き込みは一時ファイルに書いてから置き換えるので、途中で落ちても壊れたファイルは残らない。
+    モデルの推論用配列はメモリマップで読み込み、複数のワーカープロセスで同じページを共有する。
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.getenv('MODEL_DIR', DEFAULT_MODEL_DIR)
+        self.records_directory = os.path.join(self.directory, 'records')
+
+    def _path(self, name):
+        return os.path.join(self.directory, f'{name}.joblib')
+
+    def _load(self, name, mmap_mode=None):
+        path = self._path(name)
+        if not os.path.exists(path):
+            return None
+        try:
+            return joblib.load(path, mmap_mode=mmap_mode)
+        except Exception as e:
+            print(f"Error loading {path}: {e}")
+            return None
+
+    def _atomic_dump(self, obj, name):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(fd)
+        try:
+            joblib.dump(obj, tmp_path)
+            os.replace(tmp_path, self._path(name))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def load_model(self, model_type, feature_version, n_features):
+        """{'model', 'compiled', 'replay'} の辞書を返す。使えるファイルがなければNone"""
+        payload = self._load(f'{model_type}_strategy', mmap_mode='r')
+        if payload is None:
+            return None
+
+        if isinstance(payload, RandomForestClassifier):
+            # 旧形式: 特徴量の数が一致する場合だけ使う
+            if getattr(payload, 'n_features_in_', None) == n_features:
+                return {'model': payload, 'compiled': None, 'replay': None}
+            print(f"Ignoring legacy model for {model_type}: feature count mismatch")
+            return None
+
+        if not isinstance(payload, dict) or payload.get('format_version') != MODEL_FORMAT_VERSION:
+            print(f"Ignoring model for {model_type}: unsupported format")
+            return None
+        if payload.get('feature_version') != feature_version:
+            print(f"Ignoring model for {model_type}: trained on feature version {payload.get('feature_version')}")
+            return None
+        return {
+            'model': payload['model'],
+            'compiled': payload.get('compiled'),
+            'replay': payload.get('replay')
+        }
+
+    def save_model(self, model_type, model, feature_version, compiled=None, replay=None):
+        self._atomic_dump({
+            'format_version': MODEL_FORMAT_VERSION,
+            'feature_version': feature_version,
+            'model': model,
+            'compiled': compiled,
+            'replay': replay
+        }, f'{model_type}_strategy')
+
+    def load_history(self):
+        """旧形式の対局履歴（現在はgame_records形式で records/ 以下に追記している）"""
+        history = self._load('game_history')
+        return history if isinstance(history, list) else []
+
+    def load_win_rates(self):
+        win_rates = self._load('win_rates')
+        return win_rates if isinstance(win_rates, dict) else {}
+
+    def save_win_rates(self, win_rates):
+        self._atomic_dump(win_rates, 'win_rates')
@@ -0,0 +1,127 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import symmetry
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_TTL = 7 * 24 * 3600  # 秒
+
+
+class MoveCache:
+    """LLMが返した手を局面ごとに記録して再利用する
+
+    キーは (モデルの種類, 対称変換で正規化した盤面, 手番, プロンプトのバージョン)。
+    回転・反転しただけの局面でも同じエントリに当たり、手は元の向きに戻して返す。
+    メモリ上はLRUとTTLで捨て、pathを指定するとSQLiteにも書いて再起動後も使う。
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (正規化した向きのマス番号, 記録時刻)
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS moves (key TEXT PRIMARY KEY, square INTEGER, created REAL)")
+                self._db.commit()
+            except Exception as e:
+                print(f"Error opening move cache {path}: {e}")
+                self._db = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.getenv('MOVE_CACHE_SIZE', DEFAULT_MAX_ENTRIES)),
+            ttl=float(os.getenv('MOVE_CACHE_TTL', DEFAULT_TTL)),
+            path=os.getenv('MOVE_CACHE_PATH')
+        )
+
+    @staticmethod
+    def _key(model_type, black, white, current_player, prompt_version):
+        """正規化したキーと、元の向きに戻すための変換番号を返す"""
+        cb, cw, sym = symmetry.canonical(black, white)
+        return f"{model_type}:{prompt_version}:{current_player}:{cb:016x}:{cw:016x}", sym
+
+    def get(self, model_type, black, white, current_player, prompt_version):
+        """記録済みの手を (row, col) で返す（なければNone）"""
+        key, sym = self._key(model_type, black, white, current_player, prompt_version)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                entry = self._load(key, now)
+                if entry is None:
+                    self.misses += 1
+                    return None
+                self.disk_hits += 1
+                self._insert(key, entry)
+        square = symmetry.transform_square(entry[0], symmetry.INVERSE[sym])
+        return square >> 3, square & 7
+
+    def put(self, model_type, black, white, current_player, prompt_version, move):
+        key, sym = self._key(model_type, black, white, current_player, prompt_version)
+        entry = (symmetry.transform_square(move[0] * 8 + move[1], sym), time.time())
+        with self._lock:
+            self._insert(key, entry)
+            if self._db is not None:
+                try:
+                    self._db.execute("INSERT OR REPLACE INTO moves VALUES (?, ?, ?)", (key, entry[0], entry[1]))
+                    self._db.commit()
+                except Exception as e:
+                    print(f"Error writing move cache: {e}")
+
+    def _insert(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _load(self, key, now):
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute("SELECT square, created FROM moves WHERE key = ?", (key,)).fetchone()
+        except Exception as e:
+            print(f"Error reading move cache: {e}")
+            return None
+        if row is None or now - row[1] > self.ttl:
+            return None
+        return row[0], row[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM moves")
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'persistent': self._db is not None
+            }
@@ -0,0 +1,163 @@
+"""記録した対局から作る定石（序盤の手の勝敗表）
+
+例:
+    python opening_book.py                       # 保存済みの対局履歴から作る
+    python opening_book.py --self-play 2000      # ローカル探索の自己対戦（相手はランダム）も加える
+"""
+import argparse
+import itertools
+import os
+
+import numpy as np
+
+import bitboard
+import symmetry
+from game_records import RecordReader
+from model_store import DEFAULT_MODEL_DIR
+from transposition import zobrist_hash
+
+BOOK_MAX_PLY = 12  # 定石として扱う手数（初期配置からの着手数）
+BOOK_MIN_GAMES = 3  # この局数以上打たれた手だけを定石から選ぶ
+DEFAULT_BOOK_PATH = os.path.join(DEFAULT_MODEL_DIR, 'opening_book.npy')
+
+BOOK_DTYPE = np.dtype([
+    ('key', '<u8'),  # 対称変換で正規化した局面のZobristハッシュ
+    ('square', 'u1'),  # 正規化した向きでのマス番号
+    ('wins', '<u4'),  # 手番側から見た勝敗数
+    ('draws', '<u4'),
+    ('losses', '<u4'),
+])
+
+
+# 1バイトごとの立っているビットの数
+_POPCOUNT8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+
+
+def _canonical_key(black, white, current_player):
+    cb, cw, sym = symmetry.canonical(black, white)
+    return zobrist_hash(cb, cw, current_player), sym
+
+
+class OpeningBook:
+    """正規化した局面のキーでソートした配列を二分探索して定石の手を引く
+
+    局面は8通りの対称変換で正規化してあるので、回転・反転した局面も同じ行に当たる。
+    保存形式は構造化配列の.npyで、読み込み時はメモリマップする。
+    """
+
+    def __init__(self, entries=None):
+        if entries is None:
+            entries = np.zeros(0, dtype=BOOK_DTYPE)
+        self.entries = entries
+        # 二分探索用にキーだけ連続した配列にしておく
+        self.keys = np.ascontiguousarray(entries['key'])
+
+    def __len__(self):
+        return len(self.entries)
+
+    @classmethod
+    def build(cls, batches, max_ply=BOOK_MAX_PLY):
+        """対局レコード（game_records.RECORD_DTYPE）の配列の列から定石を作る"""
+        counts = {}  # (key, square) -> [勝, 分, 負]
+        for records in batches:
+            # 序盤の局面だけを取り出してから1手ずつ処理する
+            discs = _POPCOUNT8[np.ascontiguousarray(records['black'] | records['white']).view(np.uint8)]
+            records = records[discs.reshape(-1, 8).sum(axis=1) - 4 < max_ply]
+            for record in records:
+                black, white = int(record['black']), int(record['white'])
+                player = int(record['player'])
+                key, _ = _canonical_key(black, white, player)
+                # 対称な局面では同等な手を1つにまとめる
+                square = symmetry.canonical_move(black, white, int(record['square']))
+                counts.setdefault((key, square), [0, 0, 0])[1 - int(record['result'])] += 1
+
+        entries = np.zeros(len(counts), dtype=BOOK_DTYPE)
+        for i, ((key, square), (wins, draws, losses)) in enumerate(sorted(counts.items())):
+            entries[i] = (key, square, wins, draws, losses)
+        return cls(entries)
+
+    def save(self, path=DEFAULT_BOOK_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + '.tmp.npy'
+        np.save(tmp_path, self.entries)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=None):
+        """定石ファイルを読み込む（なければ空の定石）"""
+        path = path or os.getenv('OPENING_BOOK_PATH', DEFAULT_BOOK_PATH)
+        if not os.path.exists(path):
+            return cls()
+        try:
+            entries = np.load(path, mmap_mode='r')
+            if entries.dtype != BOOK_DTYPE:
+                raise ValueError(f"unexpected dtype {entries.dtype}")
+            return cls(entries)
+        except Exception as e:
+            print(f"Error loading opening book {path}: {e}")
+            return cls()
+
+    def lookup(self, black, white, current_player):
+        """局面で打たれた手の一覧を [((row, col), 勝, 分, 負), ...] で返す"""
+        if not len(self.keys):
+            return []
+        key, sym = _canonical_key(black, white, current_player)
+        start = np.searchsorted(self.keys, key, side='left')
+        end = np.searchsorted(self.keys, key, side='right')
+        inverse = symmetry.INVERSE[sym]
+        results = []
+        for entry in self.entries[start:end]:
+            square = symmetry.transform_square(int(entry['square']), inverse)
+            results.append(((square >> 3, square & 7),
+                            int(entry['wins']), int(entry['draws']), int(entry['losses'])))
+        return results
+
+    def get_move(self, black, white, current_player, min_games=BOOK_MIN_GAMES, max_ply=BOOK_MAX_PLY):
+        """定石の中で勝率（引き分けは0.5勝）が最も高い手を返す（定石外ならNone）"""
+        if not len(self.keys) or bitboard.popcount(black | white) - 4 >= max_ply:
+            return None
+        best_move = None
+        best_score = -1.0
+        for move, wins, draws, losses in self.lookup(black, white, current_player):
+            games = wins + draws + losses
+            if games < min_games:
+                continue
+            score = (wins + 0.5 * draws) / games
+            if score > best_score:
+                best_score = score
+                best_move = move
+        return best_move
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the opening book from recorded games.')
+    parser.add_argument('--output', default=os.getenv('OPENING_BOOK_PATH', DEFAULT_BOOK_PATH))
+    parser.add_argument('--max-ply', type=int, default=BOOK_MAX_PLY)
+    parser.add_argument('--self-play', type=int, default=0, help='number of extra search-vs-random games')
+    parser.add_argument('--search-time', type=float, default=0.01, help='seconds per search move')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from model_store import ModelStore
+    reader = RecordReader(ModelStore().records_directory)
+    print(f"記録済みの手: {len(reader)}")
+    batches = reader.iter_batches()
+
+    if args.self_play:
+        import arena
+        # 探索と完全ランダムの対戦を加える
+        games = arena.self_play_records(args.self_play, search_time=args.search_time,
+                                        workers=args.workers, seed=args.seed)
+        batches = itertools.chain(batches, games)
+        print(f"自己対戦: {len(games)}局")
+
+    book = OpeningBook.build(batches, max_ply=args.max_ply)
+    book.save(args.output)
+    print(f"{args.output} に {len(book)} 手を保存しました")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,90 +1,99 @@
+import bitboard
+import transposition
+
+
 class OthelloGame:
     def __init__(self):
-        self.board = [[0 for _ in range(8)] for _ in range(8)]
-        self.board[3][3] = self.board[4][4] = 1  # 白
-        self.board[3][4] = self.board[4][3] = 2  # 黒
+        # 黒・白それぞれの石の配置を64ビット整数で保持
+        self.black = bitboard.INITIAL_BLACK
+        self.white = bitboard.INITIAL_WHITE
+        self._disc_hash = transposition.disc_hash(self.black, self.white)  # 手番を含まないZobristハッシュ
         self.current_player = 2  # 黒から開始
-        self.move_history = []  # 手の履歴を記録
-        
+        self.move_history = []  # 手の履歴を (マス番号, 裏返した石のマスク, 手番) で記録
+        self._moves_cache = None  # (black, white, current_player, 合法手マスク)
+
+    @property
+    def board(self):
+        """ビットボードから組み立てた8x8のリスト盤面（1: 白, 2: 黒）"""
+        return bitboard.to_board(self.black, self.white)
+
+    @board.setter
+    def board(self, board):
+        self.black, self.white = bitboard.from_board(board)
+        self._disc_hash = transposition.disc_hash(self.black, self.white)
+
+    def _player_boards(self, player=None):
+        """(手番側, 相手側) のビットボードを返す"""
+        if player is None:
+            player = self.current_player
+        if player == 2:
+            return self.black, self.white
+        return self.white, self.black
+
+    def _legal_mask(self, player=None):
+        """合法手のビットマスクを取得（同一局面では再計算しない）"""
+        if player is None:
+            player = self.current_player
+        cache = self._moves_cache
+        if cache and cache[0] == self.black and cache[1] == self.white and cache[2] == player:
+            return cache[3]
+        mask = bitboard.legal_moves(*self._player_boards(player))
+        if player == self.current_player:
+            self._moves_cache = (self.black, self.white, player, mask)
+        return mask
+
     def get_board_state(self):
         """現在のボード状態を取得"""
-        return [row[:] for row in self.board]
+        return self.board
     
     def is_valid_move(self, row, col):
         """指定された位置が有効な手かどうかを判定"""
-        if not (0 <= row < 8 and 0 <= col < 8) or self.board[row][col] != 0:
+        if not (0 <= row < 8 and 0 <= col < 8):
             return False
-            
-        directions = [(-1,-1), (-1,0), (-1,1), (0,-1), (0,1), (1,-1), (1,0), (1,1)]
-        opponent = 1 if self.current_player == 2 else 2
-        
-        for dx, dy in directions:
-            if self._check_direction(row, col, dx, dy, opponent):
-                return True
-        return False
-    
-    def _check_direction(self, row, col, dx, dy, opponent):
-        """特定の方向に石を裏返せるかチェック"""
-        x, y = row + dx, col + dy
-        if not (0 <= x < 8 and 0 <= y < 8) or self.board[x][y] != opponent:
-            return False
-            
-        while 0 <= x < 8 and 0 <= y < 8 and self.board[x][y] == opponent:
-            x, y = x + dx, y + dy
-            
-        return 0 <= x < 8 and 0 <= y < 8 and self.board[x][y] == self.current_player
+        return bool(self._legal_mask() >> (row * 8 + col) & 1)
     
     def make_move(self, row, col):
         """指定された位置に石を置き、挟まれた石を裏返す"""
         if not self.is_valid_move(row, col):
             return False
+
+        square = row * 8 + col
+        flipped = bitboard.flips(*self._player_boards(), square)
+        self._apply_delta(square, flipped, self.current_player)
+
+        # 盤面のコピーではなく差分だけを履歴に記録
+        self.move_history.append((square, flipped, self.current_player))
             
-        directions = [(-1,-1), (-1,0), (-1,1), (0,-1), (0,1), (1,-1), (1,0), (1,1)]
-        opponent = 1 if self.current_player == 2 else 2
-        
-        self.board[row][col] = self.current_player
-        pieces_to_flip = []
-        
-        for dx, dy in directions:
-            x, y = row + dx, col + dy
-            temp_flip = []
-            while 0 <= x < 8 and 0 <= y < 8 and self.board[x][y] == opponent:
-                temp_flip.append((x, y))
-                x, y = x + dx, y + dy
-                
-            if 0 <= x < 8 and 0 <= y < 8 and self.board[x][y] == self.current_player:
-                pieces_to_flip.extend(temp_flip)
-        
-        for x, y in pieces_to_flip:
-            self.board[x][y] = self.current_player
-        
-        # 手と結果を履歴に記録
-        self.move_history.append({
-            'position': (row, col),
-            'player': self.current_player,
-            'flipped': pieces_to_flip,
-            'board_state': self.get_board_state()
-        })
-            
-        self.current_player = opponent
+        self.current_player = 3 - self.current_player
         return True
 
+    def _apply_delta(self, square, flipped, player):
+        """差分を盤面に反映（同じ差分をもう一度適用すると元に戻る）"""
+        if player == 2:
+            self.black ^= (1 << square) | flipped
+            self.white ^= flipped
+        else:
+            self.white ^= (1 << square) | flipped
+            self.black ^= flipped
+        self._disc_hash ^= transposition.ZOBRIST[player][square] ^ transposition.flip_key(flipped)
+
+    def zobrist_key(self):
+        """現在の局面（石の配置と手番）のZobristハッシュ値"""
+        if self.current_player == 1:
+            return self._disc_hash ^ transposition.ZOBRIST_SIDE
+        return self._disc_hash
+
     def has_empty_spaces(self):
         """盤面に空きマスがあるかチェック"""
-        return any(0 in row for row in self.board)
+        return (self.black | self.white) != bitboard.FULL
     
     def get_valid_moves(self):
         """現在のプレイヤーの有効な手をすべて取得"""
-        valid_moves = []
-        for i in range(8):
-            for j in range(8):
-                if self.is_valid_move(i, j):
-                    valid_moves.append((i, j))
-        return valid_moves
+        return [(s >> 3, s & 7) for s in bitboard.squares(self._legal_mask())]
     
     def should_skip_turn(self):
         """現在のプレイヤーがパスすべきかどうかを判定"""
-        return len(self.get_valid_moves()) == 0 and self.has_empty_spaces()
+        return self._legal_mask() == 0 and self.has_empty_spaces()
     
     def is_game_over(self):
         """ゲームが終了したかどうかを判定"""
@@ -93,25 +102,19 @@ class OthelloGame:
             return True
             
         # 現在のプレイヤーが置けるか確認
-        current_moves = self.get_valid_moves()
-        if current_moves:
+        if self._legal_mask():
             return False
             
-        # 相手プレイヤーが置けるか確認
-        self.current_player = 3 - self.current_player
-        opponent_moves = self.get_valid_moves()
-        self.current_player = 3 - self.current_player
-        
         # 両プレイヤーとも置けない場合
-        return not opponent_moves
+        return not self._legal_mask(3 - self.current_player)
     
     def get_winner(self):
         """勝者を判定して返す"""
         if not self.is_game_over():
             return None
             
-        black_count = sum(row.count(2) for row in self.board)
-        white_count = sum(row.count(1) for row in self.board)
+        black_count = bitboard.popcount(self.black)
+        white_count = bitboard.popcount(self.white)
         
         if black_count > white_count:
             return 2
@@ -122,19 +125,20 @@ class OthelloGame:
             
     def get_score(self):
         """現在のスコアを取得"""
-        black_count = sum(row.count(2) for row in self.board)
-        white_count = sum(row.count(1) for row in self.board)
+        black_count = bitboard.popcount(self.black)
+        white_count = bitboard.popcount(self.white)
         return {"black": black_count, "white": white_count}
     
     def to_string(self):
         """ボードを文字列として返す（LLMのための入力形式）"""
         result = ["  0 1 2 3 4 5 6 7"]
+        board = self.board
         for i in range(8):
             row = [str(i)]
             for j in range(8):
-                if self.board[i][j] == 0:
+                if board[i][j] == 0:
                     row.append("-")
-                elif self.board[i][j] == 1:
+                elif board[i][j] == 1:
                     row.append("W")
                 else:
                     row.append("B")
@@ -145,15 +149,15 @@ class OthelloGame:
         """ゲームの統計情報を取得"""
         total_moves = len(self.move_history)
         moves_by_player = {
-            1: len([m for m in self.move_history if m['player'] == 1]),
-            2: len([m for m in self.move_history if m['player'] == 2])
+            1: len([m for m in self.move_history if m[2] == 1]),
+            2: len([m for m in self.move_history if m[2] == 2])
         }
         flips_by_player = {
-            1: sum(len(m['flipped']) for m in self.move_history if m['player'] == 1),
-            2: sum(len(m['flipped']) for m in self.move_history if m['player'] == 2)
+            1: sum(bitboard.popcount(m[1]) for m in self.move_history if m[2] == 1),
+            2: sum(bitboard.popcount(m[1]) for m in self.move_history if m[2] == 2)
         }
         corners_taken = sum(1 for m in self.move_history 
-                          if m['position'] in [(0,0), (0,7), (7,0), (7,7)])
+                          if m[0] in (0, 7, 56, 63))
         
         return {
             'total_moves': total_moves,
@@ -168,7 +172,22 @@ class OthelloGame:
         if not self.move_history:
             return False
         
-        last_move = self.move_history.pop()
-        self.board = last_move['board_state']
-        self.current_player = last_move['player']
-        return True
\ No newline at end of file
+        square, flipped, player = self.move_history.pop()
+        self._apply_delta(square, flipped, player)
+        self.current_player = player
+        return True
+
+    def get_board_at(self, ply):
+        """ply手目まで打った時点の盤面（0は初期配置）を履歴の差分から復元"""
+        if not 0 <= ply <= len(self.move_history):
+            return None
+
+        black, white = self.black, self.white
+        for square, flipped, player in reversed(self.move_history[ply:]):
+            if player == 2:
+                black ^= (1 << square) | flipped
+                white ^= flipped
+            else:
+                white ^= (1 << square) | flipped
+                black ^= flipped
+        return bitboard.to_board(black, white)
\ No newline at end of file
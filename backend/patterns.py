@@ -0,0 +1,244 @@
+"""パターンの重み表による評価関数（Logistello方式）
+
+辺・角の周辺・斜めなどのマスの並び（パターン）ごとに、各マスの状態（空き/手番側/相手）を
+3進数にした添字で重みを引き、着手可能数の差の項と合わせた合計を手番側から見た最終石差の予測値とする。
+重みは対局レコードから最小二乗法で求め、進行度（石数）ごとに別の表を持つ。
+対局で使うのは環境変数 PATTERN_EVAL=1 を設定したときか、SearchEngineに evaluator= を渡したときだけ。
+
+例:
+    python patterns.py                       # 記録済みの対局レコードから重みを求める
+    python patterns.py --self-play 2000      # ローカル探索の自己対戦（相手はランダム）も加える
+"""
+import argparse
+import itertools
+import os
+
+import numpy as np
+
+import bitboard
+import symmetry
+from game_records import RecordReader
+from model_store import DEFAULT_MODEL_DIR
+
+N_PHASES = 12  # 進行度の段階数（5石ごと）
+DEFAULT_WEIGHTS_PATH = os.path.join(DEFAULT_MODEL_DIR, 'pattern_weights.npy')
+
+# 基本となるマスの並び（対称変換した位置にも同じ重み表を使う）
+PATTERNS = {
+    'edge_2x': (0, 1, 2, 3, 4, 5, 6, 7, 9, 14),
+    'corner_3x3': (0, 1, 2, 8, 9, 10, 16, 17, 18),
+    'corner_2x5': (0, 1, 2, 3, 4, 8, 9, 10, 11, 12),
+    'line_2': tuple(range(8, 16)),
+    'line_3': tuple(range(16, 24)),
+    'line_4': tuple(range(24, 32)),
+    'diag_8': (0, 9, 18, 27, 36, 45, 54, 63),
+    'diag_7': (1, 10, 19, 28, 37, 46, 55),
+    'diag_6': (2, 11, 20, 29, 38, 47),
+    'diag_5': (3, 12, 21, 30, 39),
+    'diag_4': (4, 13, 22, 31),
+}
+
+
+def _build_tables():
+    instances = []  # 盤面上の各並びのマス
+    offsets = []  # 各並びが使う重み表の先頭位置
+    offset = 0
+    for base in PATTERNS.values():
+        # 8通りの対称変換で写した並びを全て使う（左右対称な並びは両方向から読むので、評価値も対称になる）
+        for squares in dict.fromkeys(tuple(symmetry.SQUARE_MAP[sym][s] for s in base) for sym in range(8)):
+            instances.append(squares)
+            offsets.append(offset)
+        offset += 3 ** len(base)
+
+    # POWERS[s, i]: マスsがi番目の並びの何桁目か（3のべき乗、含まれなければ0）
+    powers = np.zeros((64, len(instances)), dtype=np.float64)
+    for i, squares in enumerate(instances):
+        for digit, square in enumerate(squares):
+            powers[square, i] = 3 ** digit
+    return tuple(instances), np.array(offsets, dtype=np.intp), powers, offset
+
+
+INSTANCES, OFFSETS, POWERS, N_PATTERN_WEIGHTS = _build_tables()
+MOBILITY_COLUMN = N_PATTERN_WEIGHTS  # 重み表の最後の列は着手可能数の差にかける重み
+N_WEIGHTS = N_PATTERN_WEIGHTS + 1
+_BIT_POSITIONS = np.arange(64, dtype=np.uint64)
+
+# 1バイト（1行8マス）の石の並びごとの添字への寄与（1局面だけを評価するときに使う）
+# 先頭の8行分が手番側の石、後の8行分が相手の石（2倍）で、行0には各並びの重み表の先頭位置も足しておく
+_BYTE_INDEX = np.zeros((16 * 256, len(INSTANCES)), dtype=np.intp)
+for _row in range(8):
+    for _byte in range(256):
+        _contribution = sum(POWERS[_row * 8 + c] for c in range(8) if _byte >> c & 1)
+        _BYTE_INDEX[_row * 256 + _byte] = _contribution
+        _BYTE_INDEX[(_row + 8) * 256 + _byte] = 2 * _contribution
+_BYTE_INDEX[:256] += OFFSETS
+_BYTE_BASE = np.arange(16) * 256
+
+# 添字の各桁の1と2を入れ替える表（手番側と相手を入れ替えた添字）
+_MAX_DIGITS = max(len(squares) for squares in INSTANCES)
+SWAP = np.zeros(3 ** _MAX_DIGITS, dtype=np.intp)
+for _digit in range(_MAX_DIGITS):
+    _values = np.arange(3 ** _MAX_DIGITS) // 3 ** _digit % 3
+    SWAP += np.where(_values == 0, 0, 3 - _values) * 3 ** _digit
+
+
+def _bits(x):
+    """ビットボード（整数または整数の配列）を (N, 64) の0/1配列に展開"""
+    x = np.asarray(x, dtype=np.uint64).reshape(-1, 1)
+    return ((x >> _BIT_POSITIONS) & np.uint64(1)).astype(np.float64)
+
+
+def indices(first, second):
+    """各並びの添字を (N, 並びの数) で返す（firstの石を1、secondの石を2、空きを0とした3進数）"""
+    return (_bits(first) @ POWERS + 2 * (_bits(second) @ POWERS)).astype(np.intp)
+
+
+def update_indices(idx, square, flipped, value):
+    """着手による添字の差分更新（valueは置いた側の石の値1か2で、裏返った石は3 - valueから変わる）"""
+    delta = value * POWERS[square] + (2 * value - 3) * (_bits(flipped) @ POWERS)
+    return idx + delta.astype(np.intp)
+
+
+def mobility_diff(players, opponents):
+    """手番側と相手の着手可能数の差（ビットボードの配列でまとめて計算）"""
+    players = np.asarray(players, dtype=np.uint64)
+    opponents = np.asarray(opponents, dtype=np.uint64)
+    return (_bits(bitboard.legal_moves(players, opponents)).sum(axis=1)
+            - _bits(bitboard.legal_moves(opponents, players)).sum(axis=1))
+
+
+def phase_of(discs):
+    """石数から重み表の段階を求める"""
+    return np.minimum((np.asarray(discs, dtype=np.intp) - 4) // 5, N_PHASES - 1)
+
+
+class PatternEvaluator:
+    """進行度ごとの重み表 (N_PHASES, N_WEIGHTS) による評価"""
+
+    def __init__(self, weights):
+        # メモリマップのままだと添字での参照が遅いので、通常の配列として扱う（コピーはしない）
+        self.weights = np.asarray(weights)
+
+    def evaluate(self, player, opponent):
+        """手番側から見た最終石差の予測値"""
+        phase = min((bitboard.popcount(player | opponent) - 4) // 5, N_PHASES - 1)
+        row_bytes = np.frombuffer((player | opponent << 64).to_bytes(16, 'little'), dtype=np.uint8)
+        columns = _BYTE_INDEX.take(_BYTE_BASE + row_bytes, axis=0).sum(axis=0)
+        weights = self.weights[phase]
+        mobility = (bitboard.popcount(bitboard.legal_moves(player, opponent))
+                    - bitboard.popcount(bitboard.legal_moves(opponent, player)))
+        return float(weights.take(columns).sum() + weights[MOBILITY_COLUMN] * mobility)
+
+    def evaluate_indices(self, idx, discs, mobility):
+        """手番側を1とした添字 (N, 並びの数)・石数 (N,)・着手可能数の差 (N,) からまとめて評価"""
+        phase = phase_of(discs)
+        return (self.weights[phase.reshape(-1, 1), OFFSETS + idx].sum(axis=1)
+                + self.weights[phase, MOBILITY_COLUMN] * mobility)
+
+    def evaluate_batch(self, players, opponents):
+        players = np.asarray(players, dtype=np.uint64)
+        opponents = np.asarray(opponents, dtype=np.uint64)
+        discs = _bits(players | opponents).sum(axis=1)
+        return self.evaluate_indices(indices(players, opponents), discs, mobility_diff(players, opponents))
+
+    @classmethod
+    def fit(cls, batches, damp=5.0, iter_lim=200):
+        """対局レコードの配列の列から、手番側の最終石差を目標値として重みを求める"""
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.linalg import lsqr
+
+        columns = [[] for _ in range(N_PHASES)]
+        mobilities = [[] for _ in range(N_PHASES)]
+        targets = [[] for _ in range(N_PHASES)]
+        for records in batches:
+            black = records['black'].astype(np.uint64)
+            white = records['white'].astype(np.uint64)
+            is_black = records['player'] == 2
+            player = np.where(is_black, black, white)
+            opponent = np.where(is_black, white, black)
+            idx = OFFSETS + indices(player, opponent)
+            mobility = mobility_diff(player, opponent)
+            phase = phase_of(_bits(black | white).sum(axis=1))
+            for p in range(N_PHASES):
+                mask = phase == p
+                if mask.any():
+                    columns[p].append(idx[mask].astype(np.int32))
+                    mobilities[p].append(mobility[mask])
+                    targets[p].append(records['disc_diff'][mask].astype(np.float64))
+
+        weights = np.zeros((N_PHASES, N_WEIGHTS), dtype=np.float32)
+        n_instances = len(INSTANCES)
+        for p in range(N_PHASES):
+            if not columns[p]:
+                continue
+            y = np.concatenate(targets[p])
+            # 1行あたり並びの数だけ1が立ち、最後の列に着手可能数の差が入る疎行列
+            cols = np.column_stack([np.concatenate(columns[p]), np.full(len(y), MOBILITY_COLUMN)])
+            data = np.column_stack([np.ones((len(y), n_instances)), np.concatenate(mobilities[p])])
+            A = csr_matrix((data.ravel(), cols.ravel(), np.arange(0, cols.size + 1, n_instances + 1)),
+                           shape=(len(y), N_WEIGHTS))
+            weights[p] = lsqr(A, y, damp=damp, iter_lim=iter_lim)[0]
+        return cls(weights)
+
+    def save(self, path=DEFAULT_WEIGHTS_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + '.tmp.npy'
+        np.save(tmp_path, self.weights)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=None):
+        """重みファイルを読み込む（なければNone）"""
+        path = path or os.getenv('PATTERN_WEIGHTS_PATH', DEFAULT_WEIGHTS_PATH)
+        if not os.path.exists(path):
+            return None
+        try:
+            weights = np.load(path, mmap_mode='r')
+            if weights.shape != (N_PHASES, N_WEIGHTS):
+                raise ValueError(f"unexpected shape {weights.shape}")
+            return cls(weights)
+        except Exception as e:
+            print(f"Error loading pattern weights {path}: {e}")
+            return None
+
+
+# プロセス内で共有する評価関数（PATTERN_EVAL=1 のときだけ読み込み、それ以外や重みが未学習ならNone）
+# Noneのときは探索もGameLearningも手調整の評価を使う
+shared_evaluator = PatternEvaluator.load() if os.getenv('PATTERN_EVAL') == '1' else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fit the pattern evaluation weights from game records.')
+    parser.add_argument('--output', default=os.getenv('PATTERN_WEIGHTS_PATH', DEFAULT_WEIGHTS_PATH))
+    parser.add_argument('--self-play', type=int, default=0, help='number of extra search-vs-random games')
+    parser.add_argument('--search-time', type=float, default=0.01, help='seconds per search move')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--damp', type=float, default=5.0, help='ridge regularisation for lsqr')
+    args = parser.parse_args()
+
+    from model_store import ModelStore
+    reader = RecordReader(ModelStore().records_directory)
+    print(f"記録済みの手: {len(reader)}")
+    batches = reader.iter_batches()
+    if not len(reader) and not args.self_play:
+        print("学習に使う対局がありません（--self-play で自己対戦を加えてください）")
+        return
+
+    if args.self_play:
+        import arena
+        # 探索と完全ランダムの対戦を加える
+        games = arena.self_play_records(args.self_play, search_time=args.search_time,
+                                        workers=args.workers, seed=args.seed)
+        batches = itertools.chain(batches, games)
+        print(f"自己対戦: {len(games)}局")
+
+    evaluator = PatternEvaluator.fit(batches, damp=args.damp)
+    evaluator.save(args.output)
+    print(f"{args.output} に重みを保存しました")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+import numpy as np
+
+
+class ReplayBuffer:
+    """固定サイズのリングバッファに (特徴量, ラベル) を溜める
+
+    容量を超えると古い行から上書きするので、メモリと学習コストは履歴の長さによらず一定になる。
+    """
+
+    def __init__(self, capacity, n_features):
+        self.capacity = capacity
+        self.X = np.zeros((capacity, n_features), dtype=np.float32)
+        self.y = np.zeros(capacity, dtype=np.float32)
+        self.size = 0
+        self.position = 0  # 次に書き込む行
+
+    def __len__(self):
+        return self.size
+
+    def add(self, X, y):
+        X = np.asarray(X, dtype=np.float32)[-self.capacity:]
+        y = np.asarray(y, dtype=np.float32)[-self.capacity:]
+        rows = (self.position + np.arange(len(X))) % self.capacity
+        self.X[rows] = X
+        self.y[rows] = y
+        self.position = (self.position + len(X)) % self.capacity
+        self.size = min(self.capacity, self.size + len(X))
+
+    def arrays(self):
+        """溜まっている行を (X, y) で返す（順序は問わない）"""
+        return self.X[:self.size], self.y[:self.size]
+
+    def to_arrays(self):
+        return {'X': self.X[:self.size], 'y': self.y[:self.size], 'position': self.position}
+
+    @classmethod
+    def from_arrays(cls, arrays, capacity, n_features):
+        buffer = cls(capacity, n_features)
+        X, y = np.asarray(arrays['X']), np.asarray(arrays['y'])
+        if X.ndim == 2 and X.shape[1] == n_features:
+            size = min(len(X), capacity)
+            buffer.X[:size] = X[:size]
+            buffer.y[:size] = y[:size]
+            buffer.size = size
+            buffer.position = int(arrays.get('position', size)) % capacity
+        return buffer
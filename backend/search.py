@@ -0,0 +1,212 @@
+import time
+
+import bitboard
+import endgame
+import patterns
+import transposition
+from ml_strategy import IMPORTANCE_MAP
+from transposition import TranspositionTable
+
+INF = 1 << 30
+WIN_SCORE = 100000  # 終局評価の基準値（通常の評価値より十分大きい）
+MOBILITY_WEIGHT = 8
+STABILITY_WEIGHT = 20  # 確定石1個あたり
+FRONTIER_WEIGHT = 4  # 空きマスに接する石1個あたり（少ないほど良い）
+PATTERN_SCALE = 100  # パターン評価（予測石差）を整数の評価値にする倍率
+
+# 各行の8ビットパターンに対する重要度の合計（評価関数で使用）
+_ROW_WEIGHTS = [
+    [sum(int(IMPORTANCE_MAP[r][c]) for c in range(8) if bits >> c & 1) for bits in range(256)]
+    for r in range(8)
+]
+# 手の並べ替えキー（重要度の高いマスほど先に読む）
+_ORDER_KEY = [-int(IMPORTANCE_MAP[s >> 3][s & 7]) for s in range(64)]
+
+
+class SearchTimeout(Exception):
+    """探索の持ち時間切れ"""
+
+
+def final_score(player, opponent):
+    """終局時の評価値（石差を反映しつつ勝敗を最優先）"""
+    diff = bitboard.popcount(player) - bitboard.popcount(opponent)
+    if diff > 0:
+        return WIN_SCORE + diff
+    if diff < 0:
+        return -WIN_SCORE + diff
+    return 0
+
+
+def order_moves(moves):
+    """合法手マスクを重要度順のマス番号リストにする"""
+    return sorted(bitboard.squares(moves), key=_ORDER_KEY.__getitem__)
+
+
+# プロセス内の全エンジンで共有する置換表（メモリ使用量を一定に保つ）
+shared_table = TranspositionTable()
+
+
+class SearchEngine:
+    """反復深化negamax + αβ枝刈りによるローカル探索"""
+
+    def __init__(self, time_budget=1.0, max_depth=20, table=None, endgame_empties=endgame.MAX_SOLVE_EMPTIES,
+                 evaluator=None):
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+        self.endgame_empties = endgame_empties  # この空きマス数以下は完全読みに切り替える
+        self.solver = endgame.shared_solver
+        # パターン評価は evaluator= を渡すか PATTERN_EVAL=1 のときだけ使い、既定では手調整の評価を使う
+        self.evaluator = evaluator if evaluator is not None else patterns.shared_evaluator
+        if table is None:
+            # 評価関数が違うと評価値の尺度も違うので、個別に渡された評価関数では共有の置換表を使わない
+            table = shared_table if self.evaluator is patterns.shared_evaluator else TranspositionTable()
+        self.table = table
+        self.nodes = 0
+        self._deadline = 0.0
+
+    def evaluate(self, player, opponent):
+        """手番側から見た局面の静的評価値"""
+        if self.evaluator is not None:
+            return int(PATTERN_SCALE * self.evaluator.evaluate(player, opponent))
+        score = 0
+        for r in range(8):
+            table = _ROW_WEIGHTS[r]
+            shift = r * 8
+            score += table[player >> shift & 0xFF] - table[opponent >> shift & 0xFF]
+        mobility = (bitboard.popcount(bitboard.legal_moves(player, opponent))
+                    - bitboard.popcount(bitboard.legal_moves(opponent, player)))
+        stability = (bitboard.popcount(bitboard.stable_discs(player, opponent))
+                     - bitboard.popcount(bitboard.stable_discs(opponent, player)))
+        frontier = (bitboard.popcount(bitboard.frontier_discs(opponent, player))
+                    - bitboard.popcount(bitboard.frontier_discs(player, opponent)))
+        return score + MOBILITY_WEIGHT * mobility + STABILITY_WEIGHT * stability + FRONTIER_WEIGHT * frontier
+
+    def get_move(self, board, current_player, time_budget=None):
+        """8x8のリスト盤面から最善手 (row, col) を返す"""
+        black, white = bitboard.from_board(board)
+        if current_player == 2:
+            square = self.search(black, white, time_budget, current_player)
+        else:
+            square = self.search(white, black, time_budget, current_player)
+        return None if square is None else (square >> 3, square & 7)
+
+    def get_game_move(self, game, time_budget=None):
+        """OthelloGameの局面から最善手 (row, col) を返す（置換表のキーは対局が差分で保つものを使う）"""
+        color = game.current_player
+        if color == 2:
+            square = self.search(game.black, game.white, time_budget, color, game.zobrist_key())
+        else:
+            square = self.search(game.white, game.black, time_budget, color, game.zobrist_key())
+        return None if square is None else (square >> 3, square & 7)
+
+    def search(self, player, opponent, time_budget=None, color=2, key=None):
+        """持ち時間内で読めた最も深い探索の最善手をマス番号で返す
+
+        colorは手番側の色（置換表のハッシュ計算に使用）。
+        keyは局面のZobristハッシュ値で、省略すると盤面から計算する。
+        """
+        moves = order_moves(bitboard.legal_moves(player, opponent))
+        if not moves:
+            return None
+        if len(moves) == 1:
+            return moves[0]
+
+        empties = 64 - bitboard.popcount(player | opponent)
+        if empties <= self.endgame_empties:
+            return self.solver.solve(player, opponent)[1]
+
+        budget = self.time_budget if time_budget is None else time_budget
+        self._deadline = time.perf_counter() + budget
+        self.nodes = 0
+        self.table.new_search()
+        best_move = moves[0]
+        if key is None and color == 2:
+            key = transposition.zobrist_hash(player, opponent, color)
+        elif key is None:
+            key = transposition.zobrist_hash(opponent, player, color)
+
+        for depth in range(1, min(self.max_depth, empties) + 1):
+            try:
+                score, best_move = self._search_root(player, opponent, moves, depth, key, color)
+            except SearchTimeout:
+                break
+            # 前の深さの最善手から読むと枝刈りが効きやすい
+            moves.remove(best_move)
+            moves.insert(0, best_move)
+            if abs(score) >= WIN_SCORE:
+                break  # 勝敗が確定した
+        return best_move
+
+    def _search_root(self, player, opponent, moves, depth, key, color):
+        alpha = -INF
+        best_move = moves[0]
+        for square in moves:
+            flipped = bitboard.flips(player, opponent, square)
+            score = -self._negamax(opponent & ~flipped, player | (1 << square) | flipped,
+                                   depth - 1, -INF, -alpha,
+                                   key ^ transposition.move_key(square, flipped, color), 3 - color)
+            if score > alpha:
+                alpha = score
+                best_move = square
+        self.table.store(key, depth, transposition.EXACT, alpha, best_move)
+        return alpha, best_move
+
+    def _negamax(self, player, opponent, depth, alpha, beta, key, color, passed=False):
+        self.nodes += 1
+        if not self.nodes & 255 and time.perf_counter() > self._deadline:
+            raise SearchTimeout()
+
+        if depth <= 0:
+            return self.evaluate(player, opponent)
+
+        # 置換表に十分深い結果があれば再利用する
+        alpha_orig = alpha
+        tt_move = None
+        entry = self.table.probe(key)
+        if entry is not None:
+            tt_depth, flag, tt_score, tt_move = entry
+            if tt_depth >= depth:
+                if flag == transposition.EXACT:
+                    return tt_score
+                if flag == transposition.LOWER:
+                    alpha = max(alpha, tt_score)
+                else:
+                    beta = min(beta, tt_score)
+                if alpha >= beta:
+                    return tt_score
+
+        moves = bitboard.legal_moves(player, opponent)
+        if not moves:
+            if passed:
+                return final_score(player, opponent)
+            return -self._negamax(opponent, player, depth, -beta, -alpha,
+                                  key ^ transposition.ZOBRIST_SIDE, 3 - color, True)
+
+        ordered = order_moves(moves)
+        if tt_move is not None and moves >> tt_move & 1:
+            ordered.remove(tt_move)
+            ordered.insert(0, tt_move)
+
+        best = -INF
+        best_move = None
+        for square in ordered:
+            flipped = bitboard.flips(player, opponent, square)
+            score = -self._negamax(opponent & ~flipped, player | (1 << square) | flipped,
+                                   depth - 1, -beta, -alpha,
+                                   key ^ transposition.move_key(square, flipped, color), 3 - color)
+            if score > best:
+                best = score
+                best_move = square
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+
+        if best <= alpha_orig:
+            flag = transposition.UPPER
+        elif best >= beta:
+            flag = transposition.LOWER
+        else:
+            flag = transposition.EXACT
+        self.table.store(key, depth, flag, best, best_move)
+        return best
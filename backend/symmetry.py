@@ -0,0 +1,102 @@
+"""盤面の8通りの対称変換（回転・反転）
+
+変換番号 sym (0-7) のビットは 1: 転置（row と col の入れ替え）、2: 左右反転、4: 上下反転 を表し、
+この順に適用する。sym = 0 は恒等変換。
+"""
+import numpy as np
+
+import bitboard
+
+FULL = bitboard.FULL
+
+
+def flip_vertical(x):
+    """上下反転（row -> 7 - row）"""
+    return int.from_bytes(x.to_bytes(8, 'little'), 'big')
+
+
+def mirror_horizontal(x):
+    """左右反転（col -> 7 - col）"""
+    x = ((x >> 1) & 0x5555555555555555) | ((x & 0x5555555555555555) << 1)
+    x = ((x >> 2) & 0x3333333333333333) | ((x & 0x3333333333333333) << 2)
+    return ((x >> 4) & 0x0F0F0F0F0F0F0F0F) | ((x & 0x0F0F0F0F0F0F0F0F) << 4)
+
+
+def transpose(x):
+    """転置（(row, col) -> (col, row)）"""
+    t = 0x0F0F0F0F00000000 & (x ^ (x << 28))
+    x ^= t ^ (t >> 28)
+    t = 0x3333000033330000 & (x ^ (x << 14))
+    x ^= t ^ (t >> 14)
+    t = 0x5500550055005500 & (x ^ (x << 7))
+    x ^= t ^ (t >> 7)
+    return x & FULL
+
+
+def transform(x, sym):
+    """ビットボードにsym番の変換を適用"""
+    if sym & 1:
+        x = transpose(x)
+    if sym & 2:
+        x = mirror_horizontal(x)
+    if sym & 4:
+        x = flip_vertical(x)
+    return x
+
+
+def _transform_coord(row, col, sym):
+    if sym & 1:
+        row, col = col, row
+    if sym & 2:
+        col = 7 - col
+    if sym & 4:
+        row = 7 - row
+    return row, col
+
+
+# SQUARE_MAP[sym][square]: 変換後のマス番号
+SQUARE_MAP = tuple(
+    tuple((lambda rc: rc[0] * 8 + rc[1])(_transform_coord(s >> 3, s & 7, sym)) for s in range(64))
+    for sym in range(8)
+)
+
+# INVERSE[sym]: sym番の変換を元に戻す変換の番号
+INVERSE = tuple(
+    next(inv for inv in range(8) if all(SQUARE_MAP[inv][SQUARE_MAP[sym][s]] == s for s in range(64)))
+    for sym in range(8)
+)
+
+
+# BOARD_PERMUTATIONS[sym]: 64マスの配列 x に対して x[..., BOARD_PERMUTATIONS[sym]] が変換後の盤面になる添字
+BOARD_PERMUTATIONS = np.array([SQUARE_MAP[INVERSE[sym]] for sym in range(8)], dtype=np.intp)
+
+
+def transform_square(square, sym):
+    return SQUARE_MAP[sym][square]
+
+
+def canonical(black, white):
+    """8通りの変換のうち (black, white) が最小になるものを (black, white, sym) で返す"""
+    best = (black, white, 0)
+    for sym in range(1, 8):
+        b = transform(black, sym)
+        if b > best[0]:
+            continue
+        w = transform(white, sym)
+        if (b, w) < best[:2]:
+            best = (b, w, sym)
+    return best
+
+
+def canonical_move(black, white, square):
+    """正規化した向きでのマス番号（盤面自体が対称なら同等な手のうち最小のマス番号）
+
+    canonical(black, white) と同じ向きの盤面に対するマス番号なので、
+    transform_square(結果, INVERSE[sym]) で元の盤面に同等な手へ戻せる。
+    """
+    cb, cw, sym = canonical(black, white)
+    best = SQUARE_MAP[sym][square]
+    for other in range(8):
+        if other != sym and transform(black, other) == cb and transform(white, other) == cw:
+            best = min(best, SQUARE_MAP[other][square])
+    return best
@@ -0,0 +1,65 @@
+import queue
+import threading
+import time
+
+
+class TrainingWorker:
+    """終局した対局を受け取り、バックグラウンドのスレッドで学習する
+
+    学習中に終わった対局は溜めておき、次の学習でまとめて処理する。
+    """
+
+    def __init__(self, learner):
+        self.learner = learner
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.last_train_duration = None
+        self.last_batch_size = 0
+        self.trained_games = 0
+
+    def submit(self, game):
+        """学習待ちの対局を追加（すぐに戻る）"""
+        self._ensure_started()
+        self._queue.put(game)
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='training-worker', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            games = [self._queue.get()]
+            # 溜まっている対局をまとめて1回の学習にする
+            while True:
+                try:
+                    games.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            start = time.perf_counter()
+            try:
+                self.learner.train_games(games)
+            except Exception as e:
+                print(f"Error in training worker: {e}")
+            finally:
+                self.last_train_duration = time.perf_counter() - start
+                self.last_batch_size = len(games)
+                self.trained_games += len(games)
+                for _ in games:
+                    self._queue.task_done()
+
+    def join(self):
+        """学習待ちの対局がなくなるまで待つ"""
+        self._queue.join()
+
+    def stats(self):
+        return {
+            'queue_depth': self._queue.qsize(),
+            'last_train_duration': (round(self.last_train_duration, 4)
+                                    if self.last_train_duration is not None else None),
+            'last_batch_size': self.last_batch_size,
+            'trained_games': self.trained_games
+        }
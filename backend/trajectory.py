@@ -0,0 +1,50 @@
+import numpy as np
+
+from game_records import RECORD_DTYPE, fill_disc_diff, model_index
+
+MAX_MOVES = 64  # 1局の着手数は最大60手
+
+
+class Trajectory:
+    """1局分の着手の記録（対局セッションごとに持つ）
+
+    盤面は打つ前のビットボード2枚で、手はマス番号で保持する。
+    終局時に to_records() でレコード配列に変換して GameLearning.record_game に渡す。
+    """
+
+    def __init__(self):
+        self.black = np.zeros(MAX_MOVES, dtype=np.uint64)
+        self.white = np.zeros(MAX_MOVES, dtype=np.uint64)
+        self.square = np.zeros(MAX_MOVES, dtype=np.int8)
+        self.player = np.zeros(MAX_MOVES, dtype=np.int8)  # 打った側（1: 白, 2: 黒）
+        self.mobility = np.zeros(MAX_MOVES, dtype=np.int8)  # 打つ前の有効手の数
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, black, white, square, player, mobility):
+        if self.size == MAX_MOVES:
+            return
+        i = self.size
+        self.black[i] = black
+        self.white[i] = white
+        self.square[i] = square
+        self.player[i] = player
+        self.mobility[i] = mobility
+        self.size += 1
+
+    def to_records(self, player_types, winner):
+        """レコード配列に変換（player_typesは [白のプレイヤー, 黒のプレイヤー]）"""
+        n = self.size
+        records = np.zeros(n, dtype=RECORD_DTYPE)
+        records['black'] = self.black[:n]
+        records['white'] = self.white[:n]
+        records['square'] = self.square[:n]
+        records['player'] = self.player[:n]
+        records['mobility'] = self.mobility[:n]
+        records['model'] = [model_index(player_types[player - 1]) for player in self.player[:n]]
+        if winner != 0:
+            records['result'] = np.where(self.player[:n] == winner, 1, -1)
+        fill_disc_diff(records)
+        return records
@@ -0,0 +1,126 @@
+import random
+
+import bitboard
+
+# Zobristハッシュ用の乱数表（プロセス間で同じ値になるよう固定シード）
+_rng = random.Random(0x0A1B2C3D)
+ZOBRIST = {
+    2: [_rng.getrandbits(64) for _ in range(64)],  # 黒石
+    1: [_rng.getrandbits(64) for _ in range(64)],  # 白石
+}
+ZOBRIST_SIDE = _rng.getrandbits(64)  # 白番のときにXORする
+
+# 裏返した石のキー差分を1バイトずつ引ける表（黒と白のキーを両方XOR）
+_FLIP_TABLES = [
+    [0] * 256 for _ in range(8)
+]
+for _byte in range(8):
+    for _bits in range(1, 256):
+        _low = _bits & -_bits
+        _square = _byte * 8 + _low.bit_length() - 1
+        _FLIP_TABLES[_byte][_bits] = (_FLIP_TABLES[_byte][_bits ^ _low]
+                                      ^ ZOBRIST[2][_square] ^ ZOBRIST[1][_square])
+
+# 置換表の値の種類
+EXACT = 0
+LOWER = 1  # fail-high（真の値はこれ以上）
+UPPER = 2  # fail-low（真の値はこれ以下）
+
+
+def disc_hash(black, white):
+    """石の配置だけから計算したハッシュ値"""
+    key = 0
+    for square in bitboard.squares(black):
+        key ^= ZOBRIST[2][square]
+    for square in bitboard.squares(white):
+        key ^= ZOBRIST[1][square]
+    return key
+
+
+def zobrist_hash(black, white, current_player):
+    """局面（石の配置と手番）のZobristハッシュ値"""
+    key = disc_hash(black, white)
+    return key ^ ZOBRIST_SIDE if current_player == 1 else key
+
+
+def flip_key(flipped):
+    """裏返した石のマスクに対応するハッシュ差分"""
+    key = 0
+    byte = 0
+    while flipped:
+        key ^= _FLIP_TABLES[byte][flipped & 0xFF]
+        flipped >>= 8
+        byte += 1
+    return key
+
+
+def move_key(square, flipped, player):
+    """playerがsquareに打ってflippedを裏返したときのハッシュ差分（手番の交代を含む）"""
+    return ZOBRIST[player][square] ^ flip_key(flipped) ^ ZOBRIST_SIDE
+
+
+class TranspositionTable:
+    """固定サイズの置換表
+
+    スロット数は2のべき乗で固定し、キーの下位ビットで位置を決める。
+    同じスロットに別の局面が来た場合は、古い探索世代の値か、
+    より浅い探索の値であれば置き換える。
+    """
+
+    def __init__(self, size_bits=16):
+        self.size = 1 << size_bits
+        self._mask = self.size - 1
+        self._slots = [None] * self.size  # (key, depth, flag, score, move, generation)
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.replacements = 0
+        self.rejected = 0
+
+    def new_search(self):
+        """探索開始時に世代を進める（古い値を置き換えやすくする）"""
+        self.generation = (self.generation + 1) & 0xFFFF
+
+    def probe(self, key):
+        """(depth, flag, score, move) を返す。見つからなければNone"""
+        entry = self._slots[key & self._mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1:5]
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, flag, score, move):
+        index = key & self._mask
+        entry = self._slots[index]
+        if entry is not None:
+            if entry[0] != key:
+                if entry[5] == self.generation and entry[1] > depth:
+                    # 同じ世代のより深い探索結果を優先して残す
+                    self.rejected += 1
+                    return
+                self.replacements += 1
+            elif move is None:
+                move = entry[4]  # 最善手の情報は引き継ぐ
+        self._slots[index] = (key, depth, flag, score, move, self.generation)
+        self.stores += 1
+
+    def clear(self):
+        self._slots = [None] * self.size
+        self.hits = self.misses = self.stores = self.replacements = self.rejected = 0
+
+    def stats(self):
+        """置換表のサイズ調整用の統計"""
+        probes = self.hits + self.misses
+        used = sum(1 for entry in self._slots if entry is not None)
+        return {
+            'size': self.size,
+            'used': used,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / probes, 4) if probes else 0.0,
+            'stores': self.stores,
+            'replacements': self.replacements,
+            'rejected': self.rejected
+        }
@@ -45,6 +45,8 @@ const GameSetup: React.FC<GameSetupProps> = ({ onStartGame, isLoading = false })
                     <MenuItem value="gemini">Gemini</MenuItem>
                     <MenuItem value="llama">Llama</MenuItem>
                     <MenuItem value="dify">Dify</MenuItem>
+                    <MenuItem value="search">Search (ローカル探索)</MenuItem>
+                    <MenuItem value="ensemble">Ensemble (複数LLMの合議)</MenuItem>
                 </Select>
             </FormControl>
 
@@ -59,6 +61,8 @@ const GameSetup: React.FC<GameSetupProps> = ({ onStartGame, isLoading = false })
                     <MenuItem value="gemini">Gemini</MenuItem>
                     <MenuItem value="llama">Llama</MenuItem>
                     <MenuItem value="dify">Dify</MenuItem>
+                    <MenuItem value="search">Search (ローカル探索)</MenuItem>
+                    <MenuItem value="ensemble">Ensemble (複数LLMの合議)</MenuItem>
                 </Select>
             </FormControl>
 
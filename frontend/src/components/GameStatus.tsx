@@ -18,6 +18,8 @@ const GameStatus: React.FC<GameStatusProps> = ({ gameState, player1Type, player2
             case 'gemini': return '#4285F4';
             case 'llama': return '#FF9800';
             case 'dify': return '#4CAF50';
+            case 'search': return '#9C27B0';
+            case 'ensemble': return '#E91E63';
             default: return '#666666';
         }
     };
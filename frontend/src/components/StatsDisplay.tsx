@@ -17,7 +17,9 @@ const StatsDisplay: React.FC<StatsDisplayProps> = ({ stats }) => {
     const modelColors = {
         gemini: '#4285F4',
         llama: '#FF9800',
-        dify: '#4CAF50'
+        dify: '#4CAF50',
+        search: '#9C27B0',
+        ensemble: '#E91E63'
     };
 
     return (
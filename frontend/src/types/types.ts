@@ -1,4 +1,4 @@
-export type LLMType = 'gemini' | 'llama' | 'dify';
+export type LLMType = 'gemini' | 'llama' | 'dify' | 'search' | 'ensemble';
 
 export interface GameState {
     board: number[][];